@@ -0,0 +1,120 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+# CPU cost per serial line of fanning out to websocket viewers.
+#
+# Compares the previous fan-out (one send task per client per line) with WebSocketServer.fanout
+# (frame serialized once, written to every client without a task) for 1 to 500 viewers.
+# Viewers run in a child process so only the server side is measured.
+#
+#   ENVIRONMENT=development python benchmarks/fanout_benchmark.py
+import argparse
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+import time
+
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('ENVIRONMENT', 'development')
+
+from pyscat.websocket_server import WebSocketServer  # noqa: E402
+
+SLOT = '000000000001'
+LINE = '[    1.234567] usb 1-1: new high-speed USB device number 2 using ehci-pci'
+
+
+# Connect the viewers and read until the server goes away
+async def run_viewers(port, count, compression):
+    async def viewer():
+        async with websockets.connect('ws://127.0.0.1:%d/%s' % (port, SLOT), compression=compression,
+                                      max_queue=None, ping_interval=None) as ws:
+            async for _ in ws:
+                pass
+
+    await asyncio.gather(*[viewer() for _ in range(count)], return_exceptions=True)
+
+
+async def wait_for_viewers(server, count):
+    while len(server.slot_socket_map.get(SLOT) or {}) < count:
+        await asyncio.sleep(0.05)
+
+
+async def drain(server):
+    while any(client.ws.transport.get_write_buffer_size() or client.queue or client.sending
+              for client in server.slot_socket_map[SLOT].values()):
+        await asyncio.sleep(0.001)
+
+
+async def task_per_client(server, lines):
+    clients = [client.ws for client in server.slot_socket_map[SLOT].values()]
+    for _ in range(lines):
+        await asyncio.wait([asyncio.create_task(client.send(LINE)) for client in clients])
+
+
+async def encode_once(server, lines):
+    for _ in range(lines):
+        server.fanout(SLOT, [LINE], scrollback=False)
+        await asyncio.sleep(0)
+
+
+async def measure(server, method, lines):
+    start = time.process_time()
+    await method(server, lines)
+    await drain(server)
+    return (time.process_time() - start) / lines * 1e6
+
+
+async def main(args):
+    logging.getLogger().setLevel(logging.CRITICAL)
+    server = WebSocketServer()
+    server.slot_device_map[SLOT] = True
+    compression = None if args.compression == 'none' else args.compression
+    async with websockets.serve(server.ws_handler, '127.0.0.1', args.port, compression=compression,
+                                ping_interval=None):
+        print('%8s %22s %22s' % ('viewers', 'task per client us/line', 'encode once us/line'))
+        for count in args.viewers:
+            viewers = subprocess.Popen([sys.executable, __file__, '--viewer', str(count), '--port', str(args.port),
+                                        '--compression', args.compression])
+            await wait_for_viewers(server, count)
+            legacy = await measure(server, task_per_client, args.lines)
+            fanout = await measure(server, encode_once, args.lines)
+            print('%8d %22.1f %22.1f' % (count, legacy, fanout))
+            viewers.kill()
+            viewers.wait()
+            while server.slot_socket_map.get(SLOT):
+                await asyncio.sleep(0.05)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=15090)
+    parser.add_argument('--lines', type=int, default=2000)
+    parser.add_argument('--viewers', type=int, nargs='+', default=[1, 10, 50, 100, 250, 500])
+    parser.add_argument('--compression', choices=['none', 'deflate'], default='none')
+    parser.add_argument('--viewer', type=int, help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+    if arguments.viewer:
+        compression = None if arguments.compression == 'none' else arguments.compression
+        asyncio.run(run_viewers(arguments.port, arguments.viewer, compression))
+    else:
+        asyncio.run(main(arguments))
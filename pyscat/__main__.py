@@ -21,37 +21,43 @@ import logging
 from starlette.requests import Request
 from fastapi import FastAPI
 import uvicorn
-from starlette.responses import Response
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from fastapi import Query
 
 from pyscat.config import Config
-from pyscat.device_config import DeviceConfig
+from pyscat.config_watcher import ConfigWatcher
+from pyscat.device_config import DeviceConfig, SlotMappingError
+from pyscat.device_registry import DeviceRegistry
 from pyscat.devices import Devices
+from pyscat.digi_operations import DigiOperationRunner
+from pyscat.health_collector import HealthCollector
 from pyscat.log_config import LogConfig
 from pyscat.serial.serial_connection_manager import SerialConnectionManager
 from pyscat.serial.serial_health import SerialHealthCheck
+from pyscat.slot_mapping_queue import SlotMappingQueue
+from pyscat.trace_log_writer import TraceLogWriter
+from pyscat.trace_search import TraceSearchIndex
+from pyscat.trace_store import TraceBlockStore
 from pyscat.websocket_server import WebSocketServer
 import websockets
 import asyncio
 import threading
 import codecs
+import os
+import time
 from  pyscat.digi_health import DigiHealth
 
 
 def process_request(path, header):
-    slot = path.strip("/")
-    found = False
-    print(devices)
-    for device in devices['devices']:
-        if device['id'] == slot:
-            found = True
-            break
-
-    if not found:
+    slot = WebSocketServer.get_slot(path)
+    if DeviceRegistry.get().get_device(slot) is None:
         raise ConnectionRefusedError
 
 
+# Runs the websocket server, serial output is handed to this loop through the server's bridge from the start
 def loop_in_thread(loop):
     asyncio.set_event_loop(loop)
+    server.bridge.loop = loop
     loop.run_until_complete(start_server)
     loop.run_forever()
 
@@ -62,11 +68,13 @@ def initialize_device_config():
 app = FastAPI()
 serial_health = SerialHealthCheck()
 device_config = initialize_device_config()
+health_collector = HealthCollector(serial_health, device_config.devices_config.health_interval)
+digi_operations = DigiOperationRunner(device_config.devices_config.digi_concurrency)
 devices = device_config.read_device_config()
 device_type = devices.get('deviceType', None)
 if device_type != 'UART': 
         digi = DigiHealth()
-        digi.get_digi_devices()
+        digi.refresh_in_background()
 
 # Support Rest API from Swagger
 @app.get('/scat/api/devices/')
@@ -76,6 +84,8 @@ def devices():
 
 @app.post('/scat/api/device/{deviceid}/write')
 async def device_write(deviceid, request: Request):
+    if DeviceRegistry.get().get_device(deviceid) is None:
+        raise ValueError("Unknown device " + deviceid)
     message_bytes = await request.body()
 
     if message_bytes is not None and request.headers['Content-Type'] == 'application/octet-stream':
@@ -90,27 +100,111 @@ async def device_write(deviceid, request: Request):
     return {"success": True}
 
 
+# Device lookups by device id, slot number or tty port, served from the device registry
+@app.get('/scat/api/device/{deviceid}')
+def get_device(deviceid):
+    device = DeviceRegistry.get().get_device(deviceid)
+    if device is None:
+        raise ValueError("Unknown device " + deviceid)
+    return device
+
+
+@app.get('/scat/api/slot/{slot}')
+def get_slot_devices(slot: int):
+    return {'devices': DeviceRegistry.get().get_slot_devices(slot)}
+
+
+@app.get('/scat/api/port')
+def get_port_device(port: str):
+    device = DeviceRegistry.get().get_port_device(port)
+    if device is None:
+        raise ValueError("No device on port " + port)
+    return device
+
+
+# Trace lines of a device between from and to (epoch seconds or ISO 8601), read from the time indexed store
+@app.get('/scat/api/device/{deviceid}/logs')
+def device_logs(deviceid, start: str = Query(alias='from'), end: str = Query(None, alias='to')):
+    devices_config = device_config.devices_config
+    if devices_config.trace_log_store not in ('blocks', 'both'):
+        raise ValueError("Trace log store is not enabled, set trace_log_store to blocks or both")
+    directory = LogConfig.get_trace_store_directory(devices_config, deviceid)
+    if not os.path.isdir(directory):
+        raise ValueError("No trace logs for device " + deviceid)
+    start_time = TraceBlockStore.parse_time(start)
+    end_time = TraceBlockStore.parse_time(end) if end else time.time()
+    lines = (TraceBlockStore.format_line(timestamp, message)
+             for timestamp, message in TraceBlockStore.query(directory, start_time, end_time))
+    return StreamingResponse(lines, media_type='text/plain')
+
+
+# Trace lines of every slot containing q, newest first
+@app.get('/scat/api/search')
+def search(q: str, slot: str = None, since: str = None, until: str = None, limit: int = 100, offset: int = 0):
+    devices_config = device_config.devices_config
+    if not devices_config.trace_search:
+        raise ValueError("Trace search is not enabled, set trace_search to true")
+    if not 0 < limit <= 1000 or offset < 0:
+        raise ValueError("Invalid page, limit must be 1-1000")
+    return TraceSearchIndex.get_index(devices_config).search(
+        q, slot,
+        TraceBlockStore.parse_time(since) if since else None,
+        TraceBlockStore.parse_time(until) if until else None,
+        limit, offset)
+
+
+# Recreate the search index in the background, from the block stores when trace_log_store is blocks and from
+# the text trace logs otherwise
+@app.post('/scat/api/search/rebuild')
+def rebuild_search():
+    devices_config = device_config.devices_config
+    if not devices_config.trace_search:
+        raise ValueError("Trace search is not enabled, set trace_search to true")
+    if not TraceSearchIndex.get_index(devices_config).start_rebuild(devices_config.trace_log_base,
+                                                                    devices_config.trace_log_store):
+        return JSONResponse({'success': False, 'error': "A rebuild is already running"}, status_code=409)
+    return {"success": True}
+
+
+# Slot mapping changes go through the SlotMappingQueue, bursts are written and applied once
 @app.post('/scat/api/slotMapping')
 async def update_slot_mapping(request: Request):
     slot_mapping = await request.json()
-    device_config.update_slot_mapping(slot_mapping)
-    serial_connection_manager.update_devices(device_config.read_device_config())
-    return {"success": True}
+    return await apply_slot_mapping_change(lambda devices: device_config.parse_slot_mapping(slot_mapping))
+
+
+# Many slots at once, all of them are validated first and written together or the whole request is rejected
+@app.post('/scat/api/slotMapping/bulk')
+async def bulk_update_slot_mapping(request: Request):
+    slot_mapping = await request.json()
+    if not isinstance(slot_mapping, dict):
+        raise ValueError("Invalid slot mapping format")
+    start = time.perf_counter()
+    try:
+        slot_devices = device_config.parse_bulk_slot_mapping(slot_mapping.get('slots'))
+    except SlotMappingError as e:
+        return JSONResponse({'success': False, 'errors': e.errors,
+                             'validationMs': round((time.perf_counter() - start) * 1000, 3)}, status_code=400)
+    validated = time.perf_counter()
+    result = await apply_slot_mapping_change(lambda devices: device_config.set_bulk_slot_devices(devices, slot_devices))
+    return dict(result, slots=len(slot_devices),
+                validationMs=round((validated - start) * 1000, 3),
+                applyMs=round((time.perf_counter() - validated) * 1000, 3))
 
 
 @app.put('/scat/api/slotMapping/{slot}')
 async def update_slot_mapping_for_slot(slot, request: Request):
     slot_mapping = await request.json()
-    device_config.update_slot_mapping_for_slot(slot, slot_mapping)
-    serial_connection_manager.update_devices(device_config.read_device_config())
-    return {"success": True}
+    return await apply_slot_mapping_change(lambda devices: device_config.set_slot_devices(devices, slot, slot_mapping))
 
 
 @app.delete('/scat/api/slotMapping/{slot}')
 async def delete_slot_mapping_for_slot(slot):
-    device_config.delete_slot_mapping(slot)
-    serial_connection_manager.update_devices(device_config.read_device_config())
-    return {"success": True}
+    return await apply_slot_mapping_change(lambda devices: device_config.remove_slot_devices(devices, slot))
+
+
+async def apply_slot_mapping_change(change):
+    return await asyncio.wrap_future(slot_mapping_queue.submit(change))
 
 
 @app.get("/")
@@ -123,23 +217,62 @@ async def get_scat_config():
     return device_config.get_config()
 
 
+# Served from the last background probe, fresh=true probes again
 @app.get('/scat/api/health')
-def health():
-    return serial_health.get_health()
+def health(fresh: bool = False):
+    return health_collector.get_health(fresh)
 
-@app.post('/scat/reboot')
-async def reboot():
-    await reboot_trace_devices()
+@app.get('/scat/api/clients')
+def clients():
+    return server.get_client_stats()
 
-@app.post('/scat/profile')
-async def set_profile():
-    await set_real_port_to_digi_devices()
+@app.get('/scat/api/metrics')
+def metrics():
+    trace_log_writer = TraceLogWriter.writer
+    return {'traceLogWriter': trace_log_writer.stats() if trace_log_writer is not None else None,
+            'slotMappingQueue': slot_mapping_queue.stats()}
+
+@app.get('/scat/api/loggers')
+def loggers():
+    return LogConfig.stats()
 
-async def reboot_trace_devices():
-    await digi.reboot_digi_devices() #logic can be extended to other trace devices if exists in future
+# Digi operations run on every Digi in parallel. They return the operation when it is finished,
+# with wait=false right away, its progress is at /scat/operations/{id}
+@app.post('/scat/reboot')
+async def reboot(wait: bool = True):
+    return await reboot_trace_devices(wait)
 
-async def set_real_port_to_digi_devices():
-    await digi.set_real_port_to_digi()
+@app.post('/scat/profile')
+async def set_profile(wait: bool = True):
+    return await set_real_port_to_digi_devices(wait)
+
+@app.post('/scat/probe')
+async def probe(wait: bool = True):
+    return await run_digi_operation('probe', 'probe_digi', wait)
+
+@app.get('/scat/operations/{operation_id}')
+def get_operation(operation_id):
+    operation = digi_operations.get(operation_id)
+    if operation is None:
+        raise ValueError("Unknown operation " + operation_id)
+    return operation.to_dict()
+
+async def reboot_trace_devices(wait: bool = True):
+    return await run_digi_operation('reboot', 'reboot_digi', wait) #logic can be extended to other trace devices if exists in future
+
+async def set_real_port_to_digi_devices(wait: bool = True):
+    return await run_digi_operation('profile', 'set_real_port_profiles', wait)
+
+# action is the name of the DigiHealth method run on every Digi, there is no DigiHealth on a UART rack
+async def run_digi_operation(name, action: str, wait: bool):
+    if device_type == 'UART':
+        raise ValueError("There are no Digis on this rack")
+    # a cold discovery cache waits for the router, off the event loop
+    hosts = await asyncio.to_thread(digi.get_digi_ips)
+    operation = digi_operations.start(name, hosts, getattr(digi, action))
+    if wait:
+        await operation.done.wait()
+    return operation.to_dict()
 
 @app.exception_handler(ValueError)
 async def validation_exception_handler(request, exc: Exception):
@@ -157,10 +290,24 @@ if __name__ == "__main__":
     devices = device_config.read_device_config()
     # Start Websocket Server
     server = WebSocketServer()
-    start_server = websockets.serve(server.ws_handler, '0.0.0.0', 15080, process_request=process_request)
+    compression = None if config.devices_config.ws_compression == 'none' else config.devices_config.ws_compression
+    start_server = websockets.serve(server.ws_handler, '0.0.0.0', 15080, process_request=process_request,
+                                    compression=compression,
+                                    extensions=WebSocketServer.get_extensions(config.devices_config.ws_compression))
     # Start Serial Connection to Serial ports
     serial_connection_manager = SerialConnectionManager(devices, server)
     serial_connection_manager.connect_to_devices()
+    SerialHealthCheck.connections = serial_connection_manager.device_serial_connections
+    slot_mapping_queue = SlotMappingQueue(device_config, serial_connection_manager,
+                                          config.devices_config.slot_mapping_debounce,
+                                          config.devices_config.slot_mapping_max_delay)
+    if config.devices_config.devices_watch != 'off':
+        devices_watcher = ConfigWatcher(config.devices_config.config_file_path, slot_mapping_queue.submit_reload,
+                                        config.devices_config.devices_watch,
+                                        config.devices_config.devices_watch_interval,
+                                        device_config.devices_file)
+        devices_watcher.start()
+    health_collector.start()
     loop = asyncio.get_event_loop()
     t = threading.Thread(target=loop_in_thread, args=(loop,))
     t.start()
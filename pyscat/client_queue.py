@@ -0,0 +1,141 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+import asyncio
+import time
+from collections import deque
+from threading import Lock
+from typing import List, Union
+
+from websockets import WebSocketServerProtocol, ConnectionClosed
+from websockets.frames import prepare_data
+from websockets.protocol import State
+
+
+# Bounded send queue of one websocket client.
+# Serial readers only append to the queue and never wait for the client, a sender task on the
+# websocket server loop drains it. When the queue is full the overflow policy decides what happens:
+#   drop_oldest - discard the oldest queued message
+#   drop_newest - discard the incoming message
+#   disconnect  - close the connection of the slow client
+class WebSocketClientQueue:
+    POLICIES = ('drop_oldest', 'drop_newest', 'disconnect')
+
+    def __init__(self, ws: WebSocketServerProtocol, max_size: int, overflow: str):
+        if overflow not in self.POLICIES:
+            raise ValueError("Invalid websocket client overflow policy " + str(overflow))
+        self.ws = ws
+        self.max_size = max_size
+        self.overflow = overflow
+        self.queue = deque()
+        self.lock = Lock()
+        self.loop = asyncio.get_running_loop()
+        self.ready = asyncio.Event()
+        self.overflowed = False
+        self.sent = 0
+        self.dropped = 0
+        self.sending = False
+        self.task = None
+
+    def start(self):
+        self.task = self.loop.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    # Queue messages for the client, safe to call from any thread and never blocks on the client
+    def put(self, messages: List[Union[str, bytes]]) -> None:
+        now = time.monotonic()
+        with self.lock:
+            for message in messages:
+                if len(self.queue) >= self.max_size:
+                    self.dropped += 1
+                    if self.overflow == 'drop_newest':
+                        continue
+                    if self.overflow == 'disconnect':
+                        self.overflowed = True
+                        break
+                    self.queue.popleft()
+                self.queue.append((now, message))
+        self.wake()
+
+    def wake(self):
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self.loop:
+            self.ready.set()
+        else:
+            self.loop.call_soon_threadsafe(self.ready.set)
+
+    async def run(self):
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                while self.queue or self.overflowed:
+                    if self.overflowed:
+                        await self.ws.close(1008, "Client is too slow")
+                        return
+                    with self.lock:
+                        batch = list(self.queue)
+                        self.queue.clear()
+                    self.sending = True
+                    try:
+                        for _, message in batch:
+                            await self.ws.send(message)
+                            self.sent += 1
+                    finally:
+                        self.sending = False
+        except ConnectionClosed:
+            pass
+
+    # A client can be written to directly, without its queue, when nothing is queued or being sent
+    # and its socket is keeping up. Only call from the websocket server loop.
+    def is_writable(self) -> bool:
+        return (not self.queue and not self.sending and not self.overflowed
+                and self.ws.state is State.OPEN
+                and self.ws.transport.get_write_buffer_size() < self.ws.write_limit)
+
+    # Write already serialized frames to the socket, shared by every client with the same frames key
+    def write_frames(self, frames: bytes, count: int) -> None:
+        self.ws.transport.write(frames)
+        self.sent += count
+
+    # Clients with extensions that keep state between messages need their own frames, still written without a task
+    def write_messages(self, messages: List[Union[str, bytes]]) -> None:
+        for message in messages:
+            self.ws.write_frame_sync(True, *prepare_data(message))
+        self.sent += len(messages)
+
+    # seconds the oldest queued message has been waiting
+    def lag(self) -> float:
+        with self.lock:
+            if not self.queue:
+                return 0.0
+            return time.monotonic() - self.queue[0][0]
+
+    def stats(self) -> dict:
+        return {'remoteAddress': str(self.ws.remote_address),
+                'queued': len(self.queue),
+                'lagSeconds': round(self.lag(), 3),
+                'sent': self.sent,
+                'dropped': self.dropped}
@@ -20,16 +20,116 @@ import configparser
 import logging
 import os
 
+from pyscat.config_service import ConfigService
+
 
 class SCATDevicesConfig:
     config_file_path = None
     trace_regex: str = None
     trace_log_base: str = "logs/"
+    serial_io_mode: str = "event_loop"
+    serial_read_mode: str = "chunk"
+    serial_decode_errors: str = "replace"
+    scrollback_bytes: int = 262144
+    ws_client_queue_size: int = 10000
+    ws_client_overflow: str = "drop_oldest"
+    ws_compression: str = "deflate"
+    trace_log_writer: str = "async"
+    trace_log_queue_size: int = 100000
+    trace_log_buffer_size: int = 65536
+    trace_log_flush_interval: float = 1.0
+    trace_log_fsync_interval: float = 0
+    trace_log_store: str = "text"
+    trace_store_block_size: int = 65536
+    trace_store_block_interval: float = 10
+    trace_store_retention_days: int = 5
+    serial_recording: bool = False
+    trace_search: bool = False
+    trace_search_retention_hours: float = 24
+    trace_search_max_lines: int = 5000000
+    trace_search_cache_kb: int = 8192
+    trace_log_compress_workers: int = 2
+    trace_log_compress_chunk_size: int = 1048576
+    trace_log_max_backup_bytes: int = 0
+    slot_mapping_debounce: float = 0.2
+    slot_mapping_max_delay: float = 2
+    devices_watch: str = "inotify"
+    devices_watch_interval: float = 2
+    health_interval: float = 30
+    serial_health_mode: str = "reader"
+    serial_health_idle_timeout: float = 600
+    digi_telnet_port: int = 23
+    digi_connect_timeout: float = 5
+    digi_login_timeout: float = 10
+    digi_command_timeout: float = 15
+    digi_concurrency: int = 0
+    digi_discovery_url: str = "http://192.168.100.11/mtquery/api/v2/router/capability"
+    digi_discovery_ttl: float = 300
+    digi_discovery_timeout: float = 3
 
     def __init__(self, prop):
         self.config_file_path = prop.get('devices_config_file_path')
         self.trace_regex = prop.get('trace_regex')
         self.trace_log_base = prop.get('trace_log_base')
+        # event_loop: one loop watches every port, threaded: one reader thread per port
+        self.serial_io_mode = prop.get('serial_io_mode', 'event_loop')
+        # chunk: drain everything waiting and hand lines over in batches, line: one readline every 100ms
+        self.serial_read_mode = prop.get('serial_read_mode', 'chunk')
+        # replace, backslashreplace or raw, see SerialDecoder
+        self.serial_decode_errors = prop.get('serial_decode_errors', 'replace')
+        # memory budget of the scrollback kept for every slot
+        self.scrollback_bytes = prop.getint('scrollback_bytes', 262144)
+        # messages queued per websocket client and what to do when a client falls behind, see WebSocketClientQueue
+        self.ws_client_queue_size = prop.getint('ws_client_queue_size', 10000)
+        self.ws_client_overflow = prop.get('ws_client_overflow', 'drop_oldest')
+        # deflate or none, without compression every viewer of a slot shares the same serialized frames
+        self.ws_compression = prop.get('ws_compression', 'deflate')
+        # async: trace lines are queued and written in batches by TraceLogWriter, sync: written on the read path
+        self.trace_log_writer = prop.get('trace_log_writer', 'async')
+        self.trace_log_queue_size = prop.getint('trace_log_queue_size', 100000)
+        self.trace_log_buffer_size = prop.getint('trace_log_buffer_size', 65536)
+        self.trace_log_flush_interval = prop.getfloat('trace_log_flush_interval', 1.0)
+        self.trace_log_fsync_interval = prop.getfloat('trace_log_fsync_interval', 0)
+        # text: rotating text log, blocks: time indexed TraceBlockStore, both: write both
+        self.trace_log_store = prop.get('trace_log_store', 'text')
+        self.trace_store_block_size = prop.getint('trace_store_block_size', 65536)
+        self.trace_store_block_interval = prop.getfloat('trace_store_block_interval', 10)
+        self.trace_store_retention_days = prop.getint('trace_store_retention_days', 5)
+        # record everything read from every port, see SerialRecorder
+        self.serial_recording = prop.getboolean('serial_recording', False)
+        # full text index of the trace lines of every slot, see TraceSearchIndex
+        self.trace_search = prop.getboolean('trace_search', False)
+        self.trace_search_retention_hours = prop.getfloat('trace_search_retention_hours', 24)
+        self.trace_search_max_lines = prop.getint('trace_search_max_lines', 5000000)
+        self.trace_search_cache_kb = prop.getint('trace_search_cache_kb', 8192)
+        # rotated logs are gzipped in the background, see GZipRotator
+        self.trace_log_compress_workers = prop.getint('trace_log_compress_workers', 2)
+        self.trace_log_compress_chunk_size = prop.getint('trace_log_compress_chunk_size', 1048576)
+        self.trace_log_max_backup_bytes = prop.getint('trace_log_max_backup_bytes', 0)
+        # slot mapping calls arriving within debounce seconds of each other are applied together, see SlotMappingQueue
+        self.slot_mapping_debounce = prop.getfloat('slot_mapping_debounce', 0.2)
+        self.slot_mapping_max_delay = prop.getfloat('slot_mapping_max_delay', 2)
+        # inotify, poll or off, hand edits of devices.json are validated and applied, see ConfigWatcher
+        self.devices_watch = prop.get('devices_watch', 'inotify')
+        self.devices_watch_interval = prop.getfloat('devices_watch_interval', 2)
+        # seconds between background health probes, see HealthCollector
+        self.health_interval = prop.getfloat('health_interval', 30)
+        # reader: serial port health comes from the live readers, probe: every port is opened by the health check
+        self.serial_health_mode = prop.get('serial_health_mode', 'reader')
+        # seconds an open port may go without data before the reader health reports it, 0 disables
+        self.serial_health_idle_timeout = prop.getfloat('serial_health_idle_timeout', 600)
+        # Digi command line over telnet, each step waits for its prompt up to its timeout, see DigiTelnetClient
+        self.digi_telnet_port = prop.getint('digi_telnet_port', 23)
+        self.digi_connect_timeout = prop.getfloat('digi_connect_timeout', 5)
+        self.digi_login_timeout = prop.getfloat('digi_login_timeout', 10)
+        self.digi_command_timeout = prop.getfloat('digi_command_timeout', 15)
+        # Digis worked on at the same time by reboot, profile and probe, see DigiOperationRunner
+        self.digi_concurrency = prop.getint('digi_concurrency', 0)
+        # Digis of the rack are asked from the router and cached, see DigiHealth.get_digi_devices
+        self.digi_discovery_url = prop.get('digi_discovery_url',
+                                           'http://192.168.100.11/mtquery/api/v2/router/capability')
+        self.digi_discovery_ttl = prop.getfloat('digi_discovery_ttl', 300)
+        self.digi_discovery_timeout = prop.getfloat('digi_discovery_timeout', 3)
 
 class DIGICredentials:
     digi_username: str = None
@@ -39,21 +139,35 @@ class DIGICredentials:
         self.digi_password = prop.get('digi_password')
 
 
+def parse_config(config_str: str):
+    parser = configparser.ConfigParser()
+    parser.read_string(config_str)
+    return parser
+
+
+# config.ini is parsed once and again only when it changes, see ConfigFile
+def get_config_file():
+    return ConfigService.get_file("pyscat/config/config.ini", parse_config)
+
+
 class Config:
     env: str = None
     devices_config: SCATDevicesConfig = None
+    # parser, environment and the SCATDevicesConfig built from them, shared until config.ini changes
+    cache = (None, None, None)
 
     def __init__(self):
-        config_file = "pyscat/config/config.ini"
-        parser = configparser.ConfigParser()
-        parser.read(config_file)
-        self.devices_config = SCATDevicesConfig(parser[os.environ['ENVIRONMENT']])
+        parser = get_config_file().get()
+        env = os.environ['ENVIRONMENT']
+        cached_parser, cached_env, devices_config = Config.cache
+        if cached_parser is not parser or cached_env != env:
+            devices_config = SCATDevicesConfig(parser[env])
+            Config.cache = (parser, env, devices_config)
+        self.devices_config = devices_config
 
 class DIGIConfig:
     digi_credentials: DIGICredentials = None
 
     def __init__(self):
-        config_file = "pyscat/config/config.ini"
-        parser = configparser.ConfigParser()
-        parser.read(config_file)
+        parser = get_config_file().get()
         self.digi_credentials = DIGICredentials(parser["digi"])
\ No newline at end of file
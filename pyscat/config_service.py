@@ -0,0 +1,133 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+import logging
+import os
+import tempfile
+import threading
+from typing import Callable, Dict
+
+
+# A parsed configuration file shared by the whole process.
+# The file is parsed again only when its inode, mtime or size changed since the last read, so constructing
+# Config or reading devices.json is a stat call. Writes go to a temporary file that is fsynced and renamed over
+# the original, readers never see a half written file. Subscribers are called with the new value on every change.
+# When a file that was loaded before changes to content parse rejects, the error is logged and kept in error and
+# the last good value stays in use until the file changes again. The cached value is shared, callers must not modify it.
+class ConfigFile:
+
+    def __init__(self, path: str, parse: Callable, serialize: Callable = None):
+        self.path = path
+        self.parse = parse
+        self.serialize = serialize
+        self.value = None
+        self.signature = None
+        # signature of the file as this process last wrote it, see ConfigWatcher
+        self.written_signature = None
+        self.error = None
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.system_logger = logging.getLogger('system')
+
+    @staticmethod
+    def get_signature(stat: os.stat_result):
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def get(self):
+        stat = os.stat(self.path)
+        with self.lock:
+            if self.get_signature(stat) == self.signature:
+                return self.value
+            with open(self.path) as f:
+                stat = os.fstat(f.fileno())
+                content = f.read()
+            try:
+                value = self.parse(content)
+            except Exception as e:
+                if self.value is None:
+                    raise
+                self.signature = self.get_signature(stat)
+                self.error = repr(e)
+                self.system_logger.error("Rejected " + self.path + ", keeping the previous version " + self.error)
+                return self.value
+            self.value = value
+            self.signature = self.get_signature(stat)
+            self.error = None
+        self.system_logger.info("Loaded " + self.path)
+        self.notify(value)
+        return value
+
+    # Write value atomically and make it the cached value
+    def write(self, value):
+        content = self.serialize(value)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with self.lock:
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(self.path) + '.')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write(content)
+                    f.flush()
+                    os.fsync(f.fileno())
+                if os.path.exists(self.path):
+                    os.chmod(temp_path, os.stat(self.path).st_mode & 0o7777)
+                # a rename keeps inode, mtime and size, set before the rename so a watcher never sees it unknown
+                self.written_signature = self.get_signature(os.stat(temp_path))
+                os.replace(temp_path, self.path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            self.value = value
+            self.signature = self.written_signature
+            self.error = None
+        self.notify(value)
+
+    # Call callback with the new value whenever the file changes, subscribing the same callback twice has no effect
+    def subscribe(self, callback: Callable) -> None:
+        with self.lock:
+            if callback not in self.subscribers:
+                self.subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable) -> None:
+        with self.lock:
+            if callback in self.subscribers:
+                self.subscribers.remove(callback)
+
+    def notify(self, value):
+        for callback in list(self.subscribers):
+            try:
+                callback(value)
+            except Exception as e:
+                self.system_logger.error("Config subscriber failed " + repr(e))
+
+
+# Process wide registry of configuration files, one ConfigFile per path
+class ConfigService:
+    files: Dict[str, ConfigFile] = {}
+    files_lock = threading.Lock()
+
+    @staticmethod
+    def get_file(path: str, parse: Callable, serialize: Callable = None) -> ConfigFile:
+        key = os.path.abspath(path)
+        with ConfigService.files_lock:
+            config_file = ConfigService.files.get(key)
+            if config_file is None:
+                config_file = ConfigFile(path, parse, serialize)
+                ConfigService.files[key] = config_file
+            return config_file
@@ -0,0 +1,124 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from typing import Callable
+
+from pyscat.config_service import ConfigFile
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_EVENT_HEADER = struct.Struct('iIII')
+
+
+# Watches a configuration file and calls callback when its inode, mtime or size changes.
+# With inotify the directory of the file is watched, which also catches editors and tools that replace the
+# file by renaming a new one over it. The file is stat'ed every interval seconds as well, which is all the
+# polling mode does and covers file systems where inotify reports nothing (bind mounts, network shares).
+# Changes that config_file wrote itself are not reported, only edits made by someone else.
+class ConfigWatcher:
+
+    def __init__(self, path: str, callback: Callable, mode: str = 'inotify', interval: float = 2,
+                 config_file: ConfigFile = None):
+        self.path = os.path.abspath(path)
+        self.callback = callback
+        self.config_file = config_file
+        self.mode = mode
+        self.interval = interval
+        self.system_logger = logging.getLogger('system')
+        self.signature = self.get_signature()
+        self.inotify_fd = None
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='config-watcher', daemon=True)
+
+    def start(self):
+        if self.mode == 'inotify':
+            self.inotify_fd = self.open_inotify()
+        self.system_logger.info("Watching " + self.path + " with " + ('inotify' if self.inotify_fd is not None else 'polling'))
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def get_signature(self):
+        try:
+            return ConfigFile.get_signature(os.stat(self.path))
+        except OSError:
+            return None
+
+    # inotify descriptor watching the directory of the file, None when inotify is not available
+    def open_inotify(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(os.O_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+            if libc.inotify_add_watch(fd, os.path.dirname(self.path).encode(), mask) < 0:
+                os.close(fd)
+                raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+            return fd
+        except (OSError, AttributeError) as e:
+            self.system_logger.warning("inotify is not available, polling " + self.path + " " + repr(e))
+            return None
+
+    # True when one of the inotify events read from the descriptor is about the watched file
+    def read_events(self):
+        data = os.read(self.inotify_fd, 65536)
+        name = os.path.basename(self.path).encode()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = IN_EVENT_HEADER.unpack_from(data, offset)
+            offset += IN_EVENT_HEADER.size
+            if data[offset:offset + length].rstrip(b'\0') == name:
+                return True
+            offset += length
+        return False
+
+    def run(self):
+        while self.running:
+            if self.inotify_fd is not None:
+                readable, _, _ = select.select([self.inotify_fd], [], [], self.interval)
+                if readable and not self.read_events():
+                    continue
+            else:
+                time.sleep(self.interval)
+            signature = self.get_signature()
+            if signature is None or signature == self.signature:
+                continue
+            self.signature = signature
+            if self.config_file is not None and signature == self.config_file.written_signature:
+                continue
+            try:
+                self.callback()
+            except Exception as e:
+                self.system_logger.error("Config watcher callback failed " + repr(e))
+        if self.inotify_fd is not None:
+            os.close(self.inotify_fd)
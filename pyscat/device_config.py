@@ -18,13 +18,29 @@
 
 import json
 from pyscat.config import SCATDevicesConfig
+from pyscat.config_service import ConfigService
+from pyscat.device_registry import DeviceRegistry
 from pyscat.devices import Devices
+from pyscat.serial.serial_properties import SCATLegacyDevicesMap
 import re
 from itertools import filterfalse
 import logging
 # Read devices.json file
 from pyscat.slot_mapping import SlotMapping
 
+# digi:outlet with an optional baud rate, numbers start at 1
+MAPPING_PATTERN = re.compile(r'^\s*0*([1-9][0-9]*)\s*:\s*0*([1-9][0-9]*)\s*(?::\s*0*([1-9][0-9]*)\s*)?$')
+MAX_SLOT = 0xFFF
+MAX_DEVICES_PER_SLOT = 10
+
+
+# Raised with the error of every invalid slot of a bulk slot mapping
+class SlotMappingError(ValueError):
+
+    def __init__(self, errors: dict):
+        super().__init__("Invalid slot mapping for slots " + ', '.join(errors))
+        self.errors = errors
+
 
 class DeviceConfig:
     scat_devices: Devices
@@ -32,18 +48,52 @@ class DeviceConfig:
     def __init__(self, devices_config: SCATDevicesConfig):
         self.devices_config = devices_config
         self.system_logger = logging.getLogger('system')
+        # devices.json is parsed only when it changed and written atomically, the registry follows every change
+        self.devices_file = ConfigService.get_file(devices_config.config_file_path, DeviceConfig.parse_devices,
+                                                   lambda devices: json.dumps(devices, indent=4))
+        self.devices_file.subscribe(DeviceRegistry.update)
 
+    # Parse and validate devices.json, a hand edited file that would break the serial connections is rejected
+    @staticmethod
+    def parse_devices(devices_str: str) -> Devices:
+        devices = json.loads(devices_str)
+        DeviceConfig.validate_devices(devices)
+        return devices
+
+    @staticmethod
+    def validate_devices(devices: Devices):
+        if not isinstance(devices, dict) or not isinstance(devices.get('devices'), list):
+            raise ValueError("devices must be a list")
+        ids = set()
+        for device in devices['devices']:
+            try:
+                device_id = device['id']
+                int(device_id[-3:], 16)
+                port = device['connectionProperties']['port']
+                device_type = device['type']
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError("Invalid device " + str(device)) from e
+            if device_type not in SCATLegacyDevicesMap.devices:
+                raise ValueError("Unknown device type " + str(device_type) + " for " + device_id)
+            baud = device['connectionProperties'].get('baud')
+            if baud is not None and (not isinstance(baud, int) or baud <= 0):
+                raise ValueError("Invalid baud " + str(baud) + " for " + device_id)
+            if device_id in ids:
+                raise ValueError("Duplicate device " + device_id)
+            if not isinstance(port, str):
+                raise ValueError("Invalid port " + str(port) + " for " + device_id)
+            ids.add(device_id)
+
+    # The returned devices are shared with every reader, they are replaced on change and never modified
     def read_device_config(self):
-        f = open(self.devices_config.config_file_path)
-        devices_config_str: str = f.read()
-        self.scat_devices = json.loads(devices_config_str)
+        self.scat_devices = self.devices_file.get()
         self.print_mapping()
         return self.scat_devices
 
+    # Devices are validated like a hand edit before they are written, a file that would fail at the next start is rejected
     def write_device_config(self, slot_mapping):
-        scat_config = json.dumps(slot_mapping,indent=4)
-        f = open(self.devices_config.config_file_path, 'w')
-        f.write(scat_config)
+        DeviceConfig.validate_devices(slot_mapping)
+        self.devices_file.write(slot_mapping)
         return
 
     def print_mapping(self):
@@ -56,7 +106,7 @@ class DeviceConfig:
 
 
     def get_config(self):
-        return self.scat_devices
+        return self.read_device_config()
 
     def check_mapping_contains_zero(self, stringDeviceID, stringOutlet):
         #combine the deviceID and Outlet to check if they contain 0
@@ -65,31 +115,28 @@ class DeviceConfig:
         pattern = r'^(?!.*\b0\b).*'
         return bool(re.match(pattern, stringVal))
 
-    def delete_slot_mapping(self, slot):
-        if self.scat_devices['devices']:
-            slot_hex = f"{int(slot):03x}".upper()
-            for device in self.scat_devices['devices'][:]:
-                if device['id'].endswith(slot_hex):
-                    self.scat_devices['devices'].remove(device)
-
-            self.write_device_config(self.scat_devices)
-
-    def update_slot_mapping_for_slot(self, slot, value):
-        if self.scat_devices['devices'] is not None:
-            self.delete_slot_mapping(slot)
-
-            if value:
-                if isinstance(value, list):
-                    for idx, mapping in enumerate(value):
-                        mapped_device = self.parse_mapping(slot, mapping, idx)
-                        self.scat_devices['devices'].append(mapped_device)
-                else:
-                    mapped_device = self.parse_mapping(slot, value, 0)
-                    self.scat_devices['devices'].append(mapped_device)
+    # Replace the devices of a slot in devices, without writing. The mapping is parsed before devices is modified
+    def set_slot_devices(self, devices: Devices, slot, value):
+        slot_devices = []
+        if value:
+            if isinstance(value, list):
+                slot_devices = [self.parse_mapping(slot, mapping, idx) for idx, mapping in enumerate(value)]
+            else:
+                slot_devices = [self.parse_mapping(slot, value, 0)]
+        self.remove_slot_devices(devices, slot)
+        devices['devices'].extend(slot_devices)
+        return devices
 
-            self.write_device_config(self.scat_devices)
+    # Remove the devices of a slot from devices, without writing.
+    # devices is the copy a SlotMappingQueue batch is building, which can already differ from devices.json,
+    # so the slot's devices are looked up in it rather than in the DeviceRegistry
+    def remove_slot_devices(self, devices: Devices, slot):
+        slot = int(slot)
+        devices['devices'] = [device for device in devices['devices'] if int(device['id'][-3:], 16) != slot]
+        return devices
 
-    def update_slot_mapping(self, slot_mapping: SlotMapping):
+    # Devices of a slot mapping, either in slots format or in devices.json format
+    def parse_slot_mapping(self, slot_mapping: SlotMapping) -> Devices:
         try:
             if slot_mapping is None:  # 1:1 mapping is not supported as we dont know the number of devices in the rack.
                 raise Exception(
@@ -107,12 +154,9 @@ class DeviceConfig:
                         else:
                             device = self.parse_mapping(slot, value, 0)
                             devices['devices'].append(device)
-
-                self.write_device_config(devices)
-                self.read_device_config()  # update the config
+                return devices
             elif 'devices' in slot_mapping and slot_mapping['devices'] is not None:  # slot mapping in devices.json format
-                self.write_device_config(slot_mapping)
-                self.read_device_config()  # update the config
+                return slot_mapping
             else:
                 raise ValueError("Invalid slot mapping")
         except KeyError as e:
@@ -120,6 +164,48 @@ class DeviceConfig:
         except TypeError as e:
             raise ValueError("Invalid slot mapping format") from e
 
+    # Validate every slot of a bulk slot mapping before anything is changed and build its devices.
+    # Returns the devices per slot number, a slot with an empty value has none and is removed.
+    # Raises SlotMappingError with the errors of all invalid slots.
+    def parse_bulk_slot_mapping(self, slots: dict):
+        if not isinstance(slots, dict):
+            raise ValueError("Invalid slot mapping format")
+        slot_devices = {}
+        errors = {}
+        for slot, value in slots.items():
+            try:
+                slot_number = int(slot)
+            except ValueError:
+                errors[slot] = "Invalid slot " + str(slot)
+                continue
+            if not 0 <= slot_number <= MAX_SLOT:
+                errors[slot] = "Slot must be between 0 and " + str(MAX_SLOT)
+                continue
+            values = value if isinstance(value, list) else [value] if value else []
+            if len(values) > MAX_DEVICES_PER_SLOT:
+                errors[slot] = "At most " + str(MAX_DEVICES_PER_SLOT) + " devices per slot"
+                continue
+            devices = []
+            for idx, mapping in enumerate(values):
+                match = MAPPING_PATTERN.match(mapping) if isinstance(mapping, str) else None
+                if match is None:
+                    errors[slot] = "Invalid mapping " + str(mapping) + ", expected digi:outlet or digi:outlet:baud"
+                    break
+                device_id, outlet, baud = match.groups()
+                devices.append(self.make_device(slot_number, device_id, outlet, idx, int(baud) if baud else None))
+            else:
+                slot_devices[slot_number] = devices
+        if errors:
+            raise SlotMappingError(errors)
+        return slot_devices
+
+    # Replace the devices of every slot in slot_devices, without writing
+    def set_bulk_slot_devices(self, devices: Devices, slot_devices: dict):
+        devices['devices'] = [device for device in devices['devices'] if int(device['id'][-3:], 16) not in slot_devices]
+        for slot_number in sorted(slot_devices):
+            devices['devices'].extend(slot_devices[slot_number])
+        return devices
+
     def parse_mapping(self, slot, value, idx):
         if value == 'N/A':
             raise ValueError("N/A mapping is not supported for SCAT. You can leave out the slot in the slot mapping instead.")
@@ -153,21 +239,12 @@ class DeviceConfig:
         return device
 
     def get_device_config_with_baud(self, slot, device_id, outlet, baudRate, idx):
-        id: str = ''
-        if idx == 0:
-            id = f"{int(slot):012x}".upper()
-        else:
-            id = '0000000' + str(idx) + f"{int(slot):04x}".upper()
-
-        zero_based_outlet = int(outlet) - 1
-        zero_based_device_id = int(device_id) - 1
-        tty_outlet = f"{int(zero_based_outlet):02}".upper()
-        tty = "/dev/ttyO" + str(zero_based_device_id) + "" + tty_outlet
-
-        device = {'id': id, 'type': "DTA", 'connectionProperties': {'port': tty, 'baud':int(baudRate)}}
-        return device
+        return self.make_device(slot, device_id, outlet, idx, int(baudRate))
 
     def get_device_config(self, slot, device_id, outlet, idx):
+        return self.make_device(slot, device_id, outlet, idx)
+
+    def make_device(self, slot, device_id, outlet, idx, baud=None):
         id: str = ''
         if idx == 0:
             id = f"{int(slot):012x}".upper()
@@ -180,5 +257,6 @@ class DeviceConfig:
         tty = "/dev/ttyO" + str(zero_based_device_id) + "" + tty_outlet
 
         device = {'id': id, 'type': "DTA", 'connectionProperties': {'port': tty}}
+        if baud is not None:
+            device['connectionProperties']['baud'] = baud
         return device
-
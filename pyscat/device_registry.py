@@ -0,0 +1,72 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+from types import MappingProxyType
+
+from pyscat.devices import Devices
+
+
+# Immutable view of devices.json indexed by device id, slot number and tty port
+class DeviceRegistrySnapshot:
+
+    def __init__(self, devices: Devices):
+        self.devices = devices
+        by_id = {}
+        by_slot = {}
+        by_port = {}
+        for device in devices.get('devices') or []:
+            by_id[device['id']] = device
+            # the last 3 hex digits of the device id are the slot, as used by the slot mapping endpoints
+            by_slot.setdefault(int(device['id'][-3:], 16), []).append(device)
+            by_port[device['connectionProperties']['port']] = device
+        self.by_id = MappingProxyType(by_id)
+        self.by_slot = MappingProxyType({slot: tuple(slot_devices) for slot, slot_devices in by_slot.items()})
+        self.by_port = MappingProxyType(by_port)
+
+    def get_device(self, device_id):
+        return self.by_id.get(device_id)
+
+    def get_slot_devices(self, slot):
+        return self.by_slot.get(int(slot), ())
+
+    def get_port_device(self, port):
+        return self.by_port.get(port)
+
+
+# Process wide device registry, rebuilt whenever devices.json is read or written.
+# A new snapshot is built aside and swapped in with a single assignment so readers never see a partial update.
+class DeviceRegistry:
+    snapshot: DeviceRegistrySnapshot = None
+
+    @staticmethod
+    def get():
+        snapshot = DeviceRegistry.snapshot
+        if snapshot is None:
+            return DeviceRegistrySnapshot({'devices': []})
+        return snapshot
+
+    @staticmethod
+    def is_loaded():
+        return DeviceRegistry.snapshot is not None
+
+    @staticmethod
+    def update(devices: Devices):
+        snapshot = DeviceRegistrySnapshot(devices)
+        DeviceRegistry.snapshot = snapshot
+        return snapshot
@@ -17,22 +17,32 @@
 
 
 import requests
-import telnetlib
-from pyscat.config import DIGIConfig
+from requests.adapters import HTTPAdapter
+from pyscat.config import Config, DIGIConfig
+from pyscat.digi_probe import PORTSERVER, detect_firmware, parse_probe
+from pyscat.digi_telnet import DigiTelnetClient, DigiTelnetError
 import logging
 from os import environ
 import re
 import asyncio
+import threading
 import time
 
+REBOOT_PATTERN = re.compile(r"(rebooting\.\.\.|The system is going down for reboot NOW!)")
+
+
 class DigiHealth:
     __digi_username = None
     __digi_password = None
-    __is_digi_on_rack = False
-    __digi_device_ips=[]
+    # Digi ips, whether the rack has Digis and the monotonic time they were discovered, replaced as a whole
+    discovery = None
+    discovery_lock = threading.Lock()
+    discovery_retry_interval: float = 30
+    session: requests.Session = None
 
     def __init__(self):
         self.system_logger = logging.getLogger('system')
+        self.devices_config = Config().devices_config
 
     @staticmethod
     def get_digi_username():
@@ -58,164 +68,119 @@ class DigiHealth:
         DigiHealth.__digi_password = digi_password
 
     def get_is_digi_on_rack(self):
-        return self.__is_digi_on_rack
-
-    def login_to_digi(self, host):
-        tn = telnetlib.Telnet(host, 23)
-        time.sleep(1)
-        tn.read_until(b"login: ")
-        tn.write(DigiHealth.get_digi_username().encode('ascii')+b"\n")
-        time.sleep(1)
-        response = tn.read_very_eager()
-        if 'password:' or'Password:' in response.decode('utf-8').split("\n"):
-            tn.write(DigiHealth.get_digi_password().encode('ascii')+b"\n")
-            time.sleep(3)
-        return tn
-    
+        discovery = DigiHealth.discovery
+        return discovery is not None and discovery[1]
+
+    def get_digi_ips(self):
+        return self.get_digi_devices()
+
+    # Telnet client for a Digi, not connected yet. Use it with async with to log in and close
+    def get_client(self, host) -> DigiTelnetClient:
+        return DigiTelnetClient(host, DigiHealth.get_digi_username(), DigiHealth.get_digi_password(),
+                                self.devices_config.digi_telnet_port,
+                                self.devices_config.digi_connect_timeout,
+                                self.devices_config.digi_login_timeout,
+                                self.devices_config.digi_command_timeout)
+
+    # Run a coroutine from synchronous code such as the health check, which runs outside the event loop
+    def run(self, coroutine):
+        return asyncio.run(coroutine)
+
+    # Raises DigiTelnetError when the Digi cannot be reached or does not reboot
     async def reboot_digi(self,host):
         logging.info("reboot_digi")
-        is_rebooting = False
-        try:
-            tn = self.login_to_digi(host)
-            time.sleep(1)
-            tn.write("boot action=reset".encode('ascii')+b"\n")
-            time.sleep(4)
-            response = tn.read_very_eager()
+        async with self.get_client(host) as client:
+            response = await client.command_until_closed("boot action=reset", REBOOT_PATTERN)
             logging.info(response)
-            for line in response.decode('utf-8').split("\n"):
-                if "rebooting..." or "The system is going down for reboot NOW!" in line:
-                    is_rebooting = True
-            tn.close()
-            logging.info("Is Digi with ip {} rebooting? {}".format(host,str(is_rebooting)))		
-            return is_rebooting
-        except Exception as e:
-            logging.info(e)	
-            return is_rebooting
-        
+            # the Digi either says it is rebooting or just drops the connection
+            is_rebooting = REBOOT_PATTERN.search(response) is not None or client.eof
+        logging.info("Is Digi with ip {} rebooting? {}".format(host,str(is_rebooting)))
+        if not is_rebooting:
+            raise DigiTelnetError(host + " did not reboot: " + response.strip())
+        return is_rebooting
+
+    # Returns the profiles shown by the Digi, raises DigiTelnetError when they could not be set
     async def set_real_port_profiles(self,host):
         logging.info("set_real_port_profiles")
-        try:
-            tn = self.login_to_digi(host)
-            time.sleep(1)
-            tn.write("set profile profile=realport port=1-32".encode('ascii')+b"\n")
-            time.sleep(5)
-            tn.write("show profile".encode('ascii')+b"\n")
-            time.sleep(3)
-            response = tn.read_very_eager()
-            if 'error' in response:
-                tn.write("set profile profile=realport range=1-4".encode('ascii')+b"\n")
-                time.sleep(5)
-                response = tn.read_very_eager()
-            logging.info(response)
-            tn.close()	
-        except Exception as e:
-            logging.info(e)	
-
-    def check_digi_status(self, host):
-        logging.info("checking digi status")
-        try:
-            tn = self.login_to_digi(host)
-            time.sleep(1)
-            if tn.sock is not None and tn.sock.fileno() != -1:
-                digi_status = True
-            tn.close()
-            return digi_status
-        except Exception as e:
-            logging.info(e)
-            return False
-        
-    def get_digi_uptime(self,host):
-        logging.info("checking Digi uptime")
-        try:
-            tn = self.login_to_digi(host)
-            time.sleep(1)
-            tn.write("uptime".encode('ascii')+b"\n")
-            time.sleep(2)
-            response = tn.read_very_eager()
+        async with self.get_client(host) as client:
+            await client.command("set profile profile=realport port=1-32")
+            response = await client.command("show profile")
+            if 'error' in response.lower():
+                response = await client.command("set profile profile=realport range=1-4")
             logging.info(response)
-            if "Error" in response.decode('utf-8'):
-                tn.write("display device".encode('ascii')+b"\n")
-                time.sleep(3)
-                response = tn.read_very_eager()
-                logging.info(response)
-            if "Time" in response.decode('utf-8'):
-                uptime = response.decode('utf-8').split("\n")[3].split("reboot:")[1].strip()
-            elif "uptime" in response.decode('utf-8'):
-                uptime = response.decode('utf-8').split("\n")[10].split(": ")[1].strip()
-            tn.close()
-            return {"uptime" : uptime}
-        except Exception as e:
-            return {"uptime" : "unable to fetch"}
-        
-    def get_digi_version(self,host):
-        logging.info("checking Digi version")
-        try:
-            tn = self.login_to_digi(host)
-            time.sleep(1)
-            tn.write("show versions".encode('ascii')+b"\n")
-            time.sleep(1)
-            response = tn.read_very_eager()
-            logging.info(response)
-            if "Error" in response.decode('utf-8'):
-                tn.write("display device".encode('ascii')+b"\n")
-                time.sleep(3)
-                response = tn.read_very_eager()
-                logging.info(response)
-            if "Factory" in response.decode('utf-8'):
-                version = response.decode('utf-8').split("\n")[9].split("release_")[1].strip()
-            elif "firmware" in response.decode('utf-8'):
-                version = response.decode('utf-8').split("\n")[7].split(": ")[1].strip()
-            tn.close()
-            return {"Firmware" : version}
-        except Exception as e:
-            return {"Firmware" : "Unable to fetch"}
-    
-    def get_digi_mac(self,host):
-        logging.info("Fetching digi mac")
-        try:
-            tn = self.login_to_digi(host)
-            time.sleep(1)
-            tn.write("show config".encode('ascii')+b"\n")
-            time.sleep(1)
-            response = tn.read_very_eager()
-            logging.info(response)
-            if "Error" in response.decode('utf-8'):
-                tn.write("display device".encode('ascii')+b"\n")
-                time.sleep(3)
-                response = tn.read_very_eager()
-                logging.info(response)
-            mac_regex = r"([0-9A-Fa-f]{2}[:-]){5}([0-9A-Fa-f]{2})"
-            mac_match = re.search(mac_regex, response.decode('utf-8'))
-            mac= mac_match.group(0)
-            tn.close()
-            return {"mac" : mac}
-        except Exception as e:
-            return {"mac" : "Unable to fetch"}
+        if 'error' in response.lower():
+            raise DigiTelnetError(host + " did not accept the realport profile: " + response.strip())
+        return response
 
+    # Everything the health check needs from a Digi in one login: the first command tells the firmware apart,
+    # the remaining commands of that firmware run in the same session. Raises DigiTelnetError when it fails
+    async def probe_digi(self, host):
+        result = {'host': host, 'isHealthy': True, 'firmware': None, 'version': None, 'uptime': None, 'mac': None,
+                  'error': None}
+        async with self.get_client(host) as client:
+            response = await client.command(PORTSERVER.commands[0])
+            firmware = detect_firmware(response)
+            responses = [response] if firmware is PORTSERVER else []
+            for command in firmware.commands[len(responses):]:
+                responses.append(await client.command(command))
+        logging.info(responses)
+        result.update(parse_probe(firmware, '\n'.join(responses)))
+        return result
+
+    # Pooled HTTP session for the router, connections are kept alive between discoveries
+    @staticmethod
+    def get_session() -> requests.Session:
+        if DigiHealth.session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            DigiHealth.session = session
+        return DigiHealth.session
 
+    # Digi ips from the router, cached for digi_discovery_ttl seconds.
+    # Only the first call waits for the router (bounded by digi_discovery_timeout), after that the cached list is
+    # returned right away and refreshed in the background once it is older than the ttl (stale while revalidate).
     def get_digi_devices(self):
+        discovery = DigiHealth.discovery
+        if discovery is None:
+            self.refresh_digi_devices(float('-inf'))
+            discovery = DigiHealth.discovery
+        elif time.monotonic() - discovery[2] > self.devices_config.digi_discovery_ttl:
+            self.refresh_in_background()
+        return discovery[0]
+
+    def refresh_in_background(self):
+        if not DigiHealth.discovery_lock.locked():
+            threading.Thread(target=self.refresh_digi_devices, name='digi-discovery', daemon=True).start()
+
+    # Ask the router for the Digis, unless a discovery finished after discovered_after while waiting for the lock.
+    # When the router does not answer the previous list is kept and asked for again after discovery_retry_interval
+    def refresh_digi_devices(self, discovered_after=None):
+        with DigiHealth.discovery_lock:
+            discovery = DigiHealth.discovery
+            if discovery is not None and discovered_after is not None and discovery[2] >= discovered_after:
+                return
+            try:
+                digi_device_ips, is_digi_on_rack = self.fetch_digi_devices()
+                DigiHealth.discovery = (digi_device_ips, is_digi_on_rack, time.monotonic())
+                logging.info(digi_device_ips)
+            except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as e:
+                self.system_logger.error("Digi discovery failed " + repr(e))
+                retry = time.monotonic() - self.devices_config.digi_discovery_ttl + DigiHealth.discovery_retry_interval
+                DigiHealth.discovery = (discovery[0], discovery[1], retry) if discovery else ([], False, retry)
+
+    def fetch_digi_devices(self):
         digi_device_ips = []
-        try:
-            response = requests.get("http://192.168.100.11/mtquery/api/v2/router/capability")
-            data = response.json()
-            if "TCE" in data and "metadata" in data["TCE"]:
-                self.__is_digi_on_rack = True
-                for digi_device in data["TCE"]["metadata"]:
+        is_digi_on_rack = False
+        timeout = self.devices_config.digi_discovery_timeout
+        response = DigiHealth.get_session().get(self.devices_config.digi_discovery_url, timeout=(timeout, timeout))
+        data = response.json()
+        if "TCE" in data and "metadata" in data["TCE"]:
+            is_digi_on_rack = True
+            for digi_device in data["TCE"]["metadata"]:
+                if isinstance(digi_device, dict) and digi_device.get("address"):
                     digi_device_ips.append(digi_device["address"])
-            self.__digi_device_ips = digi_device_ips
-            logging.info(self.__digi_device_ips)
-            return self.__digi_device_ips
-        except requests.exceptions.RequestException as e:
-            print(f"HTTP Request failed: {e}")
-        except ValueError:
-            print("Invalid JSON response")
-
-    async def reboot_digi_devices(self):
-        digi_device_ips = self.__digi_device_ips
-        tasks = [self.reboot_digi(digi_ip) for digi_ip in digi_device_ips]
-        return await asyncio.gather(*tasks)
-    
-    async def set_real_port_to_digi(self):
-        digi_device_ips = self.__digi_device_ips
-        tasks = [self.set_real_port_profiles(digi_ip) for digi_ip in digi_device_ips]
-        return await asyncio.gather(*tasks) 
\ No newline at end of file
+                else:
+                    self.system_logger.warning("Digi without an address in discovery " + str(digi_device))
+        return digi_device_ips, is_digi_on_rack
@@ -0,0 +1,110 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+import asyncio
+import contextlib
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, List
+
+
+# One operation (reboot, profile, probe) across the Digis of the rack, with the progress and result of every Digi
+class DigiOperation:
+
+    def __init__(self, name: str, hosts: List[str]):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.hosts = hosts
+        self.started = datetime.now(timezone.utc)
+        self.finished = None
+        self.started_monotonic = time.monotonic()
+        self.duration = None
+        self.results = OrderedDict((host, {'host': host, 'status': 'pending', 'result': None, 'error': None,
+                                           'durationSeconds': None}) for host in hosts)
+        self.done = asyncio.Event()
+
+    def get_status(self):
+        if not self.done.is_set():
+            return 'running'
+        if any(result['status'] == 'failed' for result in self.results.values()):
+            return 'failed'
+        return 'done'
+
+    def to_dict(self):
+        completed = sum(1 for result in self.results.values() if result['status'] in ('done', 'failed'))
+        return {'id': self.id, 'operation': self.name, 'status': self.get_status(),
+                'started': self.started.isoformat(), 'finished': self.finished.isoformat() if self.finished else None,
+                'durationSeconds': self.duration, 'total': len(self.hosts), 'completed': completed,
+                'results': list(self.results.values())}
+
+
+# Runs Digi operations on the event loop, every Digi of an operation in parallel, so a rack is rebooted in the
+# time of its slowest Digi. A concurrency above 0 limits the Digis worked on at a time across all operations.
+# The last max_operations operations are kept for GET /scat/operations/{id}.
+class DigiOperationRunner:
+    max_operations: int = 100
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.semaphore = None
+        self.operations = OrderedDict()
+        self.tasks = set()
+        self.system_logger = logging.getLogger('system')
+
+    # Start action(host) for every host on the running loop and return the operation without waiting for it
+    def start(self, name: str, hosts: List[str], action: Callable) -> DigiOperation:
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency) if self.concurrency > 0 else contextlib.nullcontext()
+        operation = DigiOperation(name, list(hosts))
+        self.operations[operation.id] = operation
+        while len(self.operations) > self.max_operations:
+            self.operations.popitem(last=False)
+        task = asyncio.get_running_loop().create_task(self.run(operation, action))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return operation
+
+    async def run(self, operation: DigiOperation, action: Callable):
+        try:
+            await asyncio.gather(*(self.run_host(operation, host, action) for host in operation.hosts))
+        finally:
+            operation.finished = datetime.now(timezone.utc)
+            operation.duration = round(time.monotonic() - operation.started_monotonic, 3)
+            operation.done.set()
+            self.system_logger.info("Digi " + operation.name + " " + operation.id + " " + operation.get_status()
+                                    + " in " + str(operation.duration) + "s")
+
+    async def run_host(self, operation: DigiOperation, host: str, action: Callable):
+        result = operation.results[host]
+        async with self.semaphore:
+            result['status'] = 'running'
+            start = time.monotonic()
+            try:
+                result['result'] = await action(host)
+                result['status'] = 'done'
+            except Exception as e:
+                result['error'] = repr(e)
+                result['status'] = 'failed'
+            result['durationSeconds'] = round(time.monotonic() - start, 3)
+
+    def get(self, operation_id: str) -> DigiOperation:
+        return self.operations.get(operation_id)
@@ -0,0 +1,75 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+import re
+
+MAC_PATTERN = re.compile(r"([0-9A-Fa-f]{2}[:-]){5}([0-9A-Fa-f]{2})")
+
+
+# Commands and output patterns of a Digi firmware family.
+# detect matches the output of the first command on that firmware, the other patterns pick values out of the output
+# of all its commands wherever they are, so extra or reordered lines in a firmware variant do not matter.
+class DigiFirmware:
+
+    def __init__(self, name: str, commands: tuple, detect: re.Pattern, version: re.Pattern, uptime: re.Pattern):
+        self.name = name
+        self.commands = commands
+        self.detect = detect
+        self.version = version
+        self.uptime = uptime
+
+    @staticmethod
+    def search(pattern: re.Pattern, output: str):
+        match = pattern.search(output)
+        return match.group(1).strip() if match else None
+
+
+# PortServer TS and Digi Connect firmware
+PORTSERVER = DigiFirmware('portserver', ('show versions', 'uptime', 'show config'),
+                          re.compile(r'release_|Device Versions Information'),
+                          re.compile(r'release_(\S+)'),
+                          re.compile(r'reboot:[ \t]*(.+)$', re.MULTILINE))
+
+# Connect IT and other newer firmware, display device has everything
+CONNECTIT = DigiFirmware('connectit', ('display device',),
+                         re.compile(r'firmware version|Device Information', re.IGNORECASE),
+                         re.compile(r'^[ \t]*firmware(?:[ \t]+version)?[ \t]*:[ \t]*(\S+)', re.IGNORECASE | re.MULTILINE),
+                         re.compile(r'^[ \t]*uptime[ \t]*:[ \t]*(.+)$', re.IGNORECASE | re.MULTILINE))
+
+FIRMWARES = (PORTSERVER, CONNECTIT)
+
+
+# Firmware whose first command produced output
+def detect_firmware(output: str) -> DigiFirmware:
+    if "Error" in output:
+        return CONNECTIT
+    for firmware in FIRMWARES:
+        if firmware.detect.search(output):
+            return firmware
+    return PORTSERVER
+
+
+# Version, uptime and MAC from the output of the commands of firmware.
+# Patterns of the other firmware families are tried when the detected one finds nothing
+def parse_probe(firmware: DigiFirmware, output: str) -> dict:
+    candidates = (firmware,) + tuple(other for other in FIRMWARES if other is not firmware)
+    version = next(filter(None, (DigiFirmware.search(candidate.version, output) for candidate in candidates)), None)
+    uptime = next(filter(None, (DigiFirmware.search(candidate.uptime, output) for candidate in candidates)), None)
+    mac = MAC_PATTERN.search(output)
+    return {'firmware': firmware.name, 'version': version, 'uptime': uptime, 'mac': mac.group(0) if mac else None}
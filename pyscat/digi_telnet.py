@@ -0,0 +1,194 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+import asyncio
+import logging
+import re
+
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+
+LOGIN_PROMPT = re.compile(r'(login|username):\s*$', re.IGNORECASE)
+PASSWORD_PROMPT = re.compile(r'password:\s*$', re.IGNORECASE)
+# Digi PortServer/Connect firmware prompts with #>, newer firmware with a trailing > or #
+SHELL_PROMPT = re.compile(r'(#>|[>#$])\s*$')
+LOGIN_FAILED = re.compile(r'(login incorrect|access denied|authentication failed)', re.IGNORECASE)
+
+
+# Raised when a Digi does not answer a step within its timeout or refuses the login
+class DigiTelnetError(Exception):
+    pass
+
+
+# Telnet client for the Digi command line on asyncio streams.
+# Every step waits for the prompt that ends it (login, password, shell) instead of sleeping for a fixed time,
+# with its own timeout, so an operation takes as long as the Digi needs and no longer.
+# Telnet option negotiation is answered by refusing every option, as telnetlib did.
+class DigiTelnetClient:
+
+    def __init__(self, host: str, username: str, password: str, port: int = 23,
+                 connect_timeout: float = 5, login_timeout: float = 10, command_timeout: float = 15):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.connect_timeout = connect_timeout
+        self.login_timeout = login_timeout
+        self.command_timeout = command_timeout
+        self.system_logger = logging.getLogger('system')
+        self.reader: asyncio.StreamReader = None
+        self.writer: asyncio.StreamWriter = None
+        self.buffer = ''
+        self.raw = b''
+        self.eof = False
+
+    async def __aenter__(self):
+        await self.login()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def login(self):
+        try:
+            self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port),
+                                                              self.connect_timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise DigiTelnetError("Unable to connect to " + self.host + " " + repr(e)) from e
+        await self.expect(LOGIN_PROMPT, self.login_timeout, 'login prompt')
+        self.write_line(self.username)
+        match, _ = await self.expect_any([PASSWORD_PROMPT, SHELL_PROMPT], self.login_timeout, 'password prompt')
+        if match.re is PASSWORD_PROMPT:
+            self.write_line(self.password)
+            match, output = await self.expect_any([SHELL_PROMPT, LOGIN_PROMPT], self.login_timeout, 'shell prompt')
+            if match.re is LOGIN_PROMPT or LOGIN_FAILED.search(output):
+                raise DigiTelnetError("Login to " + self.host + " failed")
+
+    def write_line(self, line: str):
+        try:
+            self.writer.write(line.encode('ascii') + b"\n")
+        except OSError as e:
+            raise DigiTelnetError(self.host + " connection failed " + repr(e)) from e
+
+    # Run a command and return its output, without the echoed command and the prompt that follows
+    async def command(self, command: str, timeout: float = None) -> str:
+        self.write_line(command)
+        _, output = await self.expect(SHELL_PROMPT, timeout or self.command_timeout, command)
+        lines = output.splitlines()
+        if lines and lines[0].strip() == command:
+            lines = lines[1:]
+        return '\n'.join(lines)
+
+    # Write a command after which the Digi goes away (reboot), returns everything read until pattern,
+    # the connection closing or being reset, or timeout
+    async def command_until_closed(self, command: str, pattern: re.Pattern, timeout: float = None) -> str:
+        self.write_line(command)
+        try:
+            match, output = await self.expect(pattern, timeout or self.command_timeout, command)
+            return output + match.group(0)
+        except DigiTelnetError:
+            return self.buffer
+
+    async def expect(self, pattern: re.Pattern, timeout: float, step: str):
+        return await self.expect_any([pattern], timeout, step)
+
+    # Read until one of patterns matches the text received so far, returns the match and the text up to its end
+    async def expect_any(self, patterns, timeout: float, step: str):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            for pattern in patterns:
+                match = pattern.search(self.buffer)
+                if match is not None:
+                    output = self.buffer[:match.end()]
+                    self.buffer = self.buffer[match.end():]
+                    return match, output[:match.start()]
+            if self.eof:
+                raise DigiTelnetError(self.host + " closed the connection waiting for " + step)
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise DigiTelnetError(self.host + " timed out waiting for " + step)
+            try:
+                data = await asyncio.wait_for(self.reader.read(4096), remaining)
+            except asyncio.TimeoutError:
+                raise DigiTelnetError(self.host + " timed out waiting for " + step) from None
+            except OSError as e:
+                # a reset is the connection closing, like EOF
+                self.eof = True
+                raise DigiTelnetError(self.host + " connection failed waiting for " + step + " " + repr(e)) from e
+            if not data:
+                self.eof = True
+            self.buffer += self.negotiate(data).decode('utf-8', 'replace').replace('\r', '')
+
+    # Strip telnet commands from data and refuse every option the Digi asks for.
+    # An incomplete command at the end of data is kept for the next read
+    def negotiate(self, data: bytes) -> bytes:
+        data = self.raw + data
+        self.raw = b''
+        text = bytearray()
+        replies = bytearray()
+        i = 0
+        while i < len(data):
+            byte = data[i]
+            if byte != IAC:
+                text.append(byte)
+                i += 1
+                continue
+            if i + 1 >= len(data):
+                self.raw = data[i:]
+                break
+            command = data[i + 1]
+            if command == IAC:
+                text.append(IAC)
+                i += 2
+            elif command in (DO, DONT, WILL, WONT):
+                if i + 2 >= len(data):
+                    self.raw = data[i:]
+                    break
+                option = data[i + 2]
+                if command == DO:
+                    replies += bytes((IAC, WONT, option))
+                elif command == WILL:
+                    replies += bytes((IAC, DONT, option))
+                i += 3
+            elif command == SB:
+                end = data.find(bytes((IAC, SE)), i + 2)
+                if end == -1:
+                    self.raw = data[i:]
+                    break
+                i = end + 2
+            else:
+                i += 2
+        if replies and self.writer is not None and not self.writer.is_closing():
+            self.writer.write(bytes(replies))
+        return bytes(text)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (OSError, ConnectionError):
+                pass
+            self.writer = None
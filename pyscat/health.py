@@ -64,6 +64,8 @@ class HealthStatus(CamelModel):
     dependencies_health_status: List[HealthReport] = []
     licenses: List[License] = []
     metadata: dict = None
+    checked_at: datetime = None
+    age_seconds: float = None
 
 
 
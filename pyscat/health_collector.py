@@ -0,0 +1,71 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+from pyscat.health import HealthStatus
+
+
+# Runs the health probes on a background thread every interval seconds and keeps the last result.
+# Health requests are served from that snapshot, with the time it was taken and its age, instead of
+# opening every serial port and logging into every Digi per request. Probes never run concurrently,
+# a request for a fresh report while a probe is running waits for that probe and uses its result.
+class HealthCollector:
+
+    def __init__(self, health_check, interval: float):
+        self.health_check = health_check
+        self.interval = interval
+        self.system_logger = logging.getLogger('system')
+        self.probe_lock = threading.Lock()
+        # last report, when it was taken and the monotonic time its probe started, replaced as a whole
+        self.snapshot = (None, None, None)
+        self.thread = threading.Thread(target=self.run, name='health-collector', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                self.system_logger.error("Health check failed " + repr(e))
+            time.sleep(self.interval)
+
+    def refresh(self, requested: float = None):
+        with self.probe_lock:
+            started = self.snapshot[2]
+            if requested is not None and started is not None and started >= requested:
+                return  # a probe started after the request finished while waiting for the lock
+            started = time.monotonic()
+            health_status = self.health_check.get_health()
+            self.snapshot = (health_status, datetime.now(timezone.utc), started)
+
+    # Last snapshot with checked_at and age_seconds, probed now when fresh is set or nothing was probed yet
+    def get_health(self, fresh: bool = False) -> HealthStatus:
+        if fresh:
+            self.refresh(time.monotonic())
+        elif self.snapshot[0] is None:
+            self.refresh(float('-inf'))  # any probe will do, including one already running
+        health_status, checked_at, started = self.snapshot
+        return health_status.model_copy(update={'checked_at': checked_at,
+                                                'age_seconds': round(time.monotonic() - started, 3)})
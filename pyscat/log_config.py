@@ -19,34 +19,227 @@
 import gzip
 import logging
 import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from logging.handlers import TimedRotatingFileHandler
 
 
+# Rotates a log file and gzips it on a background worker pool so the logging call only pays for
+# the rename. The file is compressed in fixed size chunks, written to a hidden temporary file and
+# renamed once complete. After compression the oldest rotated files are removed while the rotated
+# files of the log take more than trace_log_max_backup_bytes (0 keeps backupCount only).
 class GZipRotator:
+    executor = None
+    executor_lock = threading.Lock()
+    chunk_size: int = 1048576
+    max_backup_bytes: int = 0
+
+    @staticmethod
+    def get_executor():
+        with GZipRotator.executor_lock:
+            if GZipRotator.executor is None:
+                from pyscat.config import Config
+                devices_config = Config().devices_config
+                GZipRotator.chunk_size = devices_config.trace_log_compress_chunk_size
+                GZipRotator.max_backup_bytes = devices_config.trace_log_max_backup_bytes
+                GZipRotator.executor = ThreadPoolExecutor(max_workers=devices_config.trace_log_compress_workers,
+                                                          thread_name_prefix='log-compress')
+            return GZipRotator.executor
+
     def __call__(self, source, dest):
         os.rename(source, dest)
-        f_in = open(dest, 'rb')
-        f_out = gzip.open("%s.gz" % dest, 'wb')
-        f_out.writelines(f_in)
-        f_out.close()
-        f_in.close()
-        os.remove(dest)
+        GZipRotator.get_executor().submit(self.compress, dest)
+
+    def compress(self, dest):
+        directory, name = os.path.split(dest)
+        part = os.path.join(directory, "." + name + ".gz.part")
+        try:
+            with open(dest, 'rb') as f_in, gzip.open(part, 'wb') as f_out:
+                shutil.copyfileobj(f_in, f_out, self.chunk_size)
+            os.rename(part, "%s.gz" % dest)
+            os.remove(dest)
+            if self.max_backup_bytes:
+                self.remove_old_backups(dest)
+        except Exception as e:
+            logging.getLogger('system').error("Could not compress " + dest + " " + repr(e))
+
+    # dest is <base>.<date>, the rotated files of <base> are named <base>.<date>[.gz] and sort by date
+    def remove_old_backups(self, dest):
+        directory, name = os.path.split(dest)
+        base = name.rsplit('.', 1)[0] + '.'
+        backups = []
+        for file_name in sorted(os.listdir(directory or '.')):
+            if file_name.startswith(base) and file_name[len(base):len(base) + 1].isdigit():
+                path = os.path.join(directory, file_name)
+                backups.append((path, os.path.getsize(path)))
+        total = sum(size for _, size in backups)
+        for path, size in backups:
+            if total <= self.max_backup_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+
+# Rotating file handler that writes batches of records with one buffered write.
+# Records are written by TraceLogWriter, flush() and sync() are called on its schedule.
+class BufferedTimedRotatingFileHandler(TimedRotatingFileHandler):
 
+    def __init__(self, filename, buffer_size=65536, **kwargs):
+        self.buffer_size = buffer_size
+        super().__init__(filename, **kwargs)
 
+    def _open(self):
+        return open(self.baseFilename, self.mode, buffering=self.buffer_size,
+                    encoding=self.encoding, errors=self.errors)
+
+    # Records are queued before they are written, a batch is split where its records cross the rollover time
+    # so every line lands in the file of the day it was logged
+    def write_batch(self, records):
+        self.acquire()
+        try:
+            lines = []
+            for record in records:
+                if record.created >= self.rolloverAt:
+                    self.write_lines(lines)
+                    lines = []
+                    self.doRollover()
+                try:
+                    lines.append(self.format(record) + self.terminator)
+                except Exception:
+                    self.handleError(record)
+            self.write_lines(lines)
+        finally:
+            self.release()
+
+    def write_lines(self, lines):
+        if not lines:
+            return
+        if self.stream is None:
+            self.stream = self._open()
+        self.stream.write(''.join(lines))
+
+    def sync(self):
+        self.acquire()
+        try:
+            if self.stream is not None:
+                self.stream.flush()
+                os.fsync(self.stream.fileno())
+        finally:
+            self.release()
+
+
+# Loggers are registered by name so reconnects and slot mapping reloads reuse the logger and its
+# file handler instead of stacking another handler, and another open file, on the same logger.
 class LogConfig:
+    registry = {}
+    registry_lock = threading.Lock()
 
     @staticmethod
     def setup_logger(name, log_file, level=logging.INFO):
+        with LogConfig.registry_lock:
+            logger = LogConfig.get_registered_logger(name, log_file)
+            if logger is not None:
+                return logger
+
+            handler = TimedRotatingFileHandler(log_file,
+                                               when='midnight',
+                                               backupCount=5)
+            formatter = logging.Formatter('%(asctime)s: %(message)s')
+            handler.setFormatter(formatter)
+            handler.rotator = GZipRotator()
+            return LogConfig.register_logger(name, log_file, [handler], level)
 
-        handler = TimedRotatingFileHandler(log_file,
-                                           when='midnight',
-                                           backupCount=5)
-        formatter = logging.Formatter('%(asctime)s: %(message)s')
-        handler.setFormatter(formatter)
-        handler.rotator = GZipRotator()
+    # Logger for serial trace lines. Lines go to the rotating text log and/or the time indexed
+    # TraceBlockStore (trace_log_store) and the TraceSearchIndex (trace_search), queued and written off the read path by TraceLogWriter
+    @staticmethod
+    def setup_trace_logger(name, log_file, devices_config, level=logging.INFO):
+        if (devices_config.trace_log_writer != 'async' and devices_config.trace_log_store == 'text'
+                and not devices_config.trace_search):
+            return LogConfig.setup_logger(name, log_file, level)
+
+        from pyscat.trace_log_writer import TraceLogWriter, TraceQueueHandler
+        from pyscat.trace_search import TraceSearchIndex
+        from pyscat.trace_store import TraceBlockStore
+        with LogConfig.registry_lock:
+            logger = LogConfig.get_registered_logger(name, log_file)
+            if logger is not None:
+                return logger
+
+            handlers = []
+            if devices_config.trace_log_store in ('text', 'both'):
+                handler = BufferedTimedRotatingFileHandler(log_file,
+                                                           buffer_size=devices_config.trace_log_buffer_size,
+                                                           when='midnight',
+                                                           backupCount=5)
+                formatter = logging.Formatter('%(asctime)s: %(message)s')
+                handler.setFormatter(formatter)
+                handler.rotator = GZipRotator()
+                handlers.append(handler)
+            if devices_config.trace_log_store in ('blocks', 'both'):
+                handlers.append(TraceBlockStore(LogConfig.get_trace_store_directory(devices_config, name),
+                                                block_size=devices_config.trace_store_block_size,
+                                                block_interval=devices_config.trace_store_block_interval,
+                                                retention_days=devices_config.trace_store_retention_days))
+            if devices_config.trace_search:
+                handlers.append(TraceSearchIndex.get_index(devices_config))
+            if devices_config.trace_log_writer == 'async':
+                handlers = [TraceQueueHandler(TraceLogWriter.get_writer(devices_config), handlers)]
+            return LogConfig.register_logger(name, log_file, handlers, level)
+
+    @staticmethod
+    def get_trace_store_directory(devices_config, name):
+        return os.path.join(devices_config.trace_log_base, 'store', name)
+
+    @staticmethod
+    def get_registered_logger(name, log_file):
+        if name in LogConfig.registry and LogConfig.registry[name][0] == log_file:
+            return logging.getLogger(name)
+        return None
+
+    # Replace whatever handlers were registered for the logger, the old handlers and their files are closed.
+    # A TraceQueueHandler closes its targets on the writer thread once the records queued before are written
+    @staticmethod
+    def register_logger(name, log_file, handlers, level):
         logger = logging.getLogger(name)
         logger.setLevel(level)
-        logger.addHandler(handler)
-
+        if name in LogConfig.registry:
+            for old_handler in LogConfig.registry[name][1]:
+                logger.removeHandler(old_handler)
+                old_handler.close()
+        for handler in handlers:
+            logger.addHandler(handler)
+        LogConfig.registry[name] = (log_file, handlers)
         return logger
 
+    @staticmethod
+    def count_open_files(handler):
+        if hasattr(handler, 'targets'):
+            return sum(LogConfig.count_open_files(target) for target in handler.targets)
+        if getattr(handler, 'data_file', None) is not None:
+            return 2
+        return 1 if getattr(handler, 'stream', None) is not None else 0
+
+    # Registered loggers with their handler and open file counts
+    @staticmethod
+    def stats():
+        with LogConfig.registry_lock:
+            loggers = []
+            open_files = 0
+            handlers = 0
+            for name, (log_file, registered) in LogConfig.registry.items():
+                logger_open_files = sum(LogConfig.count_open_files(handler) for handler in registered)
+                logger_handlers = len(logging.getLogger(name).handlers)
+                handlers += logger_handlers
+                open_files += logger_open_files
+                loggers.append({'name': name, 'logFile': log_file, 'handlers': logger_handlers,
+                                'openFiles': logger_open_files})
+        try:
+            process_fds = len(os.listdir('/proc/self/fd'))
+        except OSError:
+            process_fds = None
+        return {'loggerCount': len(loggers),
+                'handlerCount': handlers,
+                'openFileCount': open_files,
+                'processFdCount': process_fds,
+                'loggers': loggers}
@@ -0,0 +1,57 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+import asyncio
+from collections import deque
+from threading import Lock
+from typing import Callable, List
+
+
+# Hands items from any thread to a callback on one event loop.
+# Items are appended to a deque without waiting and the loop is woken at most once until it has
+# drained them, so a burst of items from many threads is delivered in one call.
+class LoopBridge:
+
+    def __init__(self, callback: Callable[[List], None]):
+        self.callback = callback
+        self.loop: asyncio.AbstractEventLoop = None
+        self.pending = deque()
+        self.lock = Lock()
+        self.scheduled = False
+        self.wakeups = 0
+        self.delivered = 0
+
+    def push(self, item) -> None:
+        self.pending.append(item)
+        with self.lock:
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self.loop.call_soon_threadsafe(self.drain)
+
+    def drain(self) -> None:
+        with self.lock:
+            self.scheduled = False
+        items = []
+        while self.pending:
+            items.append(self.pending.popleft())
+        if items:
+            self.wakeups += 1
+            self.delivered += len(items)
+            self.callback(items)
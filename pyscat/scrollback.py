@@ -0,0 +1,56 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+from collections import deque
+from threading import Lock
+from typing import List, Optional, Union
+
+
+# Bounded in-memory scrollback of the most recent lines printed by one slot.
+# The oldest lines are evicted once the buffer holds more than max_bytes.
+class ScrollbackBuffer:
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.lines = deque()
+        self.lock = Lock()
+
+    def extend(self, messages: List[Union[str, bytes]]) -> None:
+        with self.lock:
+            for message in messages:
+                self.lines.append(message)
+                self.size += len(message) + 1
+            while self.size > self.max_bytes and self.lines:
+                self.size -= len(self.lines.popleft()) + 1
+
+    # Last lines of the scrollback, limited to at most max_lines lines and max_bytes bytes
+    def tail(self, max_lines: Optional[int] = None, max_bytes: Optional[int] = None) -> List[Union[str, bytes]]:
+        with self.lock:
+            result = []
+            size = 0
+            for message in reversed(self.lines):
+                size += len(message) + 1
+                if max_lines is not None and len(result) >= max_lines:
+                    break
+                if max_bytes is not None and size > max_bytes:
+                    break
+                result.append(message)
+            result.reverse()
+            return result
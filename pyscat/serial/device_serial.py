@@ -17,6 +17,8 @@
 
 
 import asyncio
+import io
+import os
 
 from pyscat.config import Config
 from pyscat.devices import Devices, Device
@@ -28,6 +30,9 @@ import logging
 from threading import Lock
 
 from pyscat.log_config import LogConfig
+from pyscat.serial.serial_decoder import SerialDecoder
+from pyscat.serial.serial_recording import SerialRecorder, SerialReplay
+from pyscat.serial.serial_stats import SerialConnectionStats
 from pyscat.serial.serial_properties import SCATLegacyDevicesMap, SerialProperties
 import re
 from websockets import ConnectionClosed
@@ -42,10 +47,25 @@ class DeviceSerialConnection:
     callback = None
     is_error: bool = False
     close_connection: bool = False
+    io_engine = None
+    max_line_length: int = 4096
+    decode_error_interval: int = 60
+    serial_settings = ('baud', 'parity', 'stop_bits', 'data_bits')
 
     def __init__(self, device: Device):
         self.device = device
         self.formatter = logging.Formatter('%(asctime)s: %(message)s')
+        self.system_logger = logging.getLogger('system')
+        self.logger = None
+        self.error_logger = None
+        self.properties = None
+        self.pending = bytearray()
+        self.recorder = None
+        self.replay = None
+        self.read_mode = self.config.devices_config.serial_read_mode
+        self.decoder = SerialDecoder(self.config.devices_config.serial_decode_errors)
+        self.last_decode_error_report = -self.decode_error_interval
+        self.stats = SerialConnectionStats()
 
     # Start serial connection on a seperate thread
     def connect_to_device(self, server):
@@ -56,69 +76,208 @@ class DeviceSerialConnection:
 
     def close_connection_to_device(self):
         self.close_connection = True;
+        if self.io_engine is not None:
+            self.io_engine.remove_connection(self)
 
     def start_loop(self, loop, server):
         asyncio.set_event_loop(loop)
         loop.run_until_complete(self.read_from_serial_device(server))
 
+    # Only an opened port backed by a real file descriptor can be watched by the io engine
+    @staticmethod
+    def supports_event_loop(ser: Serial):
+        try:
+            ser.fileno()
+            return True
+        except (AttributeError, io.UnsupportedOperation):
+            return False
+
+    def setup_loggers(self):
+        self.properties = self.get_properties()
+        self.logger = LogConfig.setup_trace_logger(self.device['id'],
+                                                   self.config.devices_config.trace_log_base + "/" + self.device['id'] + ".log",
+                                                   self.config.devices_config)
+        self.error_logger = LogConfig.setup_logger(self.device['id']+'-error',
+                                                   self.config.devices_config.trace_log_base + "/"
+                                                   + self.device['id'] + '-error' + ".log")
+
+    # Open the serial port, timeout=0 makes reads non blocking.
+    # A device with a replay connection property reads a recording played on a pseudo terminal instead,
+    # a device with record (or serial_recording) appends everything read to a recording.
+    # If any step fails whatever was opened so far is closed again before the error is raised.
+    def open_serial(self, timeout=1):
+        properties = self.properties
+        connection_properties = self.device['connectionProperties']
+        port = connection_properties['port']
+        try:
+            if connection_properties.get('replay'):
+                self.replay = SerialReplay(connection_properties['replay'],
+                                           float(connection_properties.get('replaySpeed', 1)),
+                                           bool(connection_properties.get('replayRepeat', False)))
+                port = self.replay.port
+            self.ser = serial.Serial(port=port,
+                                     baudrate=properties.baud,
+                                     stopbits=properties.stop_bits,
+                                     parity=properties.parity,
+                                     bytesize=properties.data_bits,
+                                     timeout=timeout)
+            self.stats.opened()
+            if self.replay is not None:
+                self.replay.start()
+            if connection_properties.get('record', self.config.devices_config.serial_recording):
+                self.recorder = SerialRecorder(os.path.join(self.config.devices_config.trace_log_base, 'recordings',
+                                                            self.device['id'] + time.strftime('-%Y%m%d-%H%M%S.rec')))
+        except Exception:
+            self.close_serial()
+            raise
+        return self.ser
+
+    def close_serial(self):
+        self.stats.closed()
+        try:
+            if self.ser is not None:
+                self.ser.close()
+            if self.recorder is not None:
+                self.recorder.close()
+            if self.replay is not None:
+                self.replay.stop()
+        except Exception as e:
+            self.system_logger.error("error " + repr(e))
+        self.recorder = None
+        self.replay = None
+
+    # Read everything waiting on the port, waits for the first byte up to the port timeout
+    def read_available(self):
+        data = self.ser.read(self.ser.in_waiting or 1)
+        if data:
+            self.stats.record_bytes(len(data))
+            if self.recorder is not None:
+                self.recorder.write(data)
+        return data
+
+    # Split a chunk read from the port into complete lines, keeping any partial line for the next chunk.
+    # A partial line longer than max_line_length is flushed as is so the buffer stays bounded.
+    def split_lines(self, data: bytes):
+        self.pending += data
+        end = self.pending.rfind(b'\n')
+        if end == -1:
+            if len(self.pending) < self.max_line_length:
+                return []
+            end = len(self.pending) - 1
+        lines = bytes(self.pending[:end + 1]).splitlines(keepends=True)
+        del self.pending[:end + 1]
+        return lines
+
+    # Count decode errors and report them at most once per decode_error_interval seconds
+    # instead of once per bad line, a wrong baud rate would otherwise flood the logs
+    def decode_error(self):
+        self.is_error = True
+        now = time.monotonic()
+        if now - self.last_decode_error_report >= self.decode_error_interval:
+            self.last_decode_error_report = now
+            message = (self.device['id'] + "  " + str(self.decoder.decode_errors)
+                       + " serial log lines could not be decoded. Check Baud rate setting. Currently set to "
+                       + str(self.properties.baud))
+            self.system_logger.error(message)
+            self.error_logger.error(message)
+
+    def decode(self, data: bytes):
+        errors = self.decoder.decode_errors
+        message = self.decoder.decode(data).rstrip()
+        if self.decoder.decode_errors != errors:
+            self.decode_error()
+        return message
+
+    # Handle a batch of lines read from the serial port, the whole batch is sent to websocket clients at once
+    async def handle_lines(self, server, lines):
+        self.stats.record_lines(len(lines))
+        if self.discover_mode:
+            p = re.compile(r'(?:[0-9a-fA-F]:?){12}')
+            for data in lines:
+                message = self.decode(data)
+                if isinstance(message, bytes):
+                    continue
+                macs = re.findall(p, message)
+                self.system_logger.info(self.device['id'] + '  ' + '\n'.join(map(str, macs)));
+            return
+
+        messages = []
+        self.is_error = False
+        for data in lines:
+            message = self.decode(data)
+            if isinstance(message, bytes):  # raw policy, log escaped and send as a binary frame
+                self.logger.info(self.device['id'] + '  ' + message.decode('utf-8', 'backslashreplace'));
+            else:
+                self.logger.info(self.device['id'] + '  ' + message);
+            messages.append(message)
+        await server.distribute_lines(self.device['id'], messages)
+
+    # Read one chunk from the port, mode line reads a single line, mode chunk drains everything waiting
+    def read_chunk(self):
+        if self.read_mode == 'line':
+            data = self.ser.readline()
+            if data:
+                self.stats.record_bytes(len(data))
+                if self.recorder is not None:
+                    self.recorder.write(data)
+            return data
+        return self.read_available()
+
     # Start a serial connection and wait for messages to arrive on teh serial port
     async def read_from_serial_device(self, server):
-        properties = self.get_properties()
-        logger = LogConfig.setup_logger(self.device['id'],
-                                        self.config.devices_config.trace_log_base + "/" + self.device['id'] + ".log")
-        error_logger = LogConfig.setup_logger(self.device['id']+'-error',
-                                              self.config.devices_config.trace_log_base + "/"
-                                              + self.device['id'] + '-error' + ".log")
-        system_logger = logging.getLogger('system')
+        self.setup_loggers()
 
         await server.register_device(self.device['id'], self)
         while not self.close_connection:
             try:
-                self.ser = serial.Serial(port=self.device['connectionProperties']['port'],
-                                         baudrate=properties.baud,
-                                         stopbits=properties.stop_bits,
-                                         parity=properties.parity,
-                                         bytesize=properties.data_bits,
-                                         timeout=1)
-
-                while not self.close_connection:
-                    try:
+                try:
+                    self.open_serial()
+                    while not self.close_connection:
                         # data = ser.read_until('/r/n')
-                        data = self.ser.readline()
-                        if data:
-                            if self.discover_mode:
-                                message = data.decode('utf-8').rstrip()
-                                p = re.compile(r'(?:[0-9a-fA-F]:?){12}')
-                                macs = re.findall(p, message)
-                                system_logger.info(self.device['id'] + '  ' + '\n'.join(map(str, macs)));
+                        data = self.read_chunk()
+                        if self.read_mode == 'line':
+                            if data:
+                                await self.handle_lines(server, [data])
                             else:
-                                data_string = data.decode('utf-8').rstrip();
-                                logger.info(self.device['id'] + '  ' + data_string);
-                                await server.distribute(self.device['id'], data_string)
-
-                        self.is_error = False
-                        time.sleep(0.1)
-                    except UnicodeDecodeError as e:  # Bad Baud rate ??
-                        await server.distribute(self.device['id'],
-                                                "Could not decode serial log. Check Baud rate setting. Currently set to " + properties.baud + "  " + repr(
-                                                    e))
-                        system_logger.error(
-                            "Could not decode serial log. Check Baud rate setting. Currently set to " + properties.baud + "  " + repr(
-                                e))
-                        error_logger.error(
-                            "Could not decode serial log. Check Baud rate setting. Currently set to " + properties.baud + "  " + repr(
-                                e))
-                        self.is_error = True
+                                self.is_error = False
+                            time.sleep(0.1)
+                        elif data:
+                            await self.handle_lines(server, self.split_lines(data))
+                finally:
+                    self.close_serial()
             except ConnectionClosed as e:  # try reconnecting
                 # ConnectionClosed https://websockets.readthedocs.io/en/stable/faq.html
                 pass
             except Exception as e:  # try reconnecting
-                system_logger.error("error "+repr(e))
-                error_logger.error("error "+repr(e))
+                self.system_logger.error("error "+repr(e))
+                self.error_logger.error("error "+repr(e))
                 self.is_error = True
+                self.stats.record_error(repr(e))
                # await server.distribute(self.device['id'], repr(e))
                 time.sleep(5)  # retry connection forever
 
+    # The parts of a device that need the port reopened when they change, everything but type and serial settings
+    def connection_key(self, device: Device):
+        return ({key: value for key, value in device.items() if key not in ('type', 'connectionProperties')},
+                {key: value for key, value in device['connectionProperties'].items()
+                 if key not in self.serial_settings})
+
+    # True when device differs from the current one only in type or serial settings, which can be applied to the open port
+    def can_retune(self, device: Device):
+        return self.connection_key(device) == self.connection_key(self.device)
+
+    # Apply new serial settings without closing the port, the loggers and websocket clients are left untouched
+    def retune(self, device: Device):
+        self.device = device
+        self.properties = self.get_properties()
+        ser = self.ser
+        if ser is not None and ser.is_open:
+            ser.apply_settings({'baudrate': self.properties.baud,
+                                'stopbits': self.properties.stop_bits,
+                                'parity': self.properties.parity,
+                                'bytesize': self.properties.data_bits})
+        self.system_logger.info(device['id'] + "  retuned to " + str(self.properties.baud))
+
     # Get overriding serial properties if any
     def get_properties(self):
         with self.lock:
@@ -16,33 +16,79 @@
 
 
 
-from typing import List
+import logging
+import time
+from typing import Dict
 
-from pyscat.devices import Devices
+from pyscat.devices import Devices, Device
 from serial import Serial
 from pyscat.serial.device_serial import DeviceSerialConnection
+from pyscat.serial.serial_io_engine import SerialIOEngine
 
 
 # Serial connection Manager
 class SerialConnectionManager:
     ser: Serial = None
-    device_serial_connections: List[DeviceSerialConnection]
+    device_serial_connections: Dict[str, DeviceSerialConnection]
 
     def __init__(self, devices: Devices, server):
         self.devices = devices
-        self.device_serial_connections = []
+        self.device_serial_connections = {}
         self.server = server
+        self.system_logger = logging.getLogger('system')
+        self.io_engine = None
+        if DeviceSerialConnection.config.devices_config.serial_io_mode == 'event_loop':
+            self.io_engine = SerialIOEngine()
 
+    # Apply a new device list by diffing it against the running connections.
+    # Only added, removed and changed devices are touched, unchanged slots keep their port, loggers and websocket clients.
     def update_devices(self, devices: Devices):
-        for device_serial_connection in self.device_serial_connections:
-            device_serial_connection.close_connection_to_device()
+        start = time.monotonic()
+        new_devices = {device['id']: device for device in devices['devices']}
+        added, removed, retuned, restarted = [], [], [], []
+
+        for device_id in list(self.device_serial_connections):
+            if device_id not in new_devices:
+                self.device_serial_connections.pop(device_id).close_connection_to_device()
+                removed.append(device_id)
+
+        for device_id, device in new_devices.items():
+            device_serial_connection = self.device_serial_connections.get(device_id)
+            if device_serial_connection is None:
+                self.connect_to_device(device)
+                added.append(device_id)
+            elif device_serial_connection.device == device:
+                continue
+            elif device_serial_connection.can_retune(device):
+                self.retune_device(device_serial_connection, device)
+                retuned.append(device_id)
+            else:
+                device_serial_connection.close_connection_to_device()
+                self.connect_to_device(device)
+                restarted.append(device_id)
 
-        self.device_serial_connections = []
         self.devices = devices
-        self.connect_to_devices()
+        changes = {'added': added, 'removed': removed, 'retuned': retuned, 'restarted': restarted}
+        self.system_logger.info("Devices updated in " + str(round((time.monotonic() - start) * 1000, 1)) + "ms "
+                                + str(changes))
+        return changes
 
     def connect_to_devices(self):
         for device in self.devices['devices']:
-            device_serial_connection: DeviceSerialConnection = DeviceSerialConnection(device)
+            self.connect_to_device(device)
+
+    def connect_to_device(self, device: Device):
+        device_serial_connection: DeviceSerialConnection = DeviceSerialConnection(device)
+        if self.io_engine is not None:
+            # ports without a file descriptor are moved to a threaded reader once opened, see SerialIOEngine
+            self.io_engine.add_connection(device_serial_connection, self.server)
+        else:
+            # threaded reader is kept as a fallback
             device_serial_connection.connect_to_device(self.server)
-            self.device_serial_connections.append(device_serial_connection)
\ No newline at end of file
+        self.device_serial_connections[device['id']] = device_serial_connection
+
+    def retune_device(self, device_serial_connection: DeviceSerialConnection, device: Device):
+        if device_serial_connection.io_engine is not None:
+            device_serial_connection.io_engine.retune_connection(device_serial_connection, device)
+        else:
+            device_serial_connection.retune(device)
@@ -0,0 +1,54 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+import codecs
+from typing import Union
+
+
+# Incremental UTF-8 decoder for one serial port.
+# Bytes that are not valid UTF-8 never cause a line to be dropped, they are handled by the error policy:
+#   replace          - replaced with U+FFFD
+#   backslashreplace - replaced with \xNN escapes
+#   raw              - the line is passed through undecoded as bytes
+class SerialDecoder:
+    POLICIES = ('replace', 'backslashreplace', 'raw')
+
+    def __init__(self, errors: str = 'replace'):
+        if errors not in self.POLICIES:
+            raise ValueError("Invalid decode error policy " + str(errors))
+        self.errors = errors
+        self.decode_errors = 0
+        decoder = codecs.getincrementaldecoder('utf-8')
+        self.decoder = decoder('strict')
+        self.fallback = decoder('replace' if errors == 'raw' else errors)
+
+    # Decode a line, a multi byte sequence split across calls is completed on the next call
+    def decode(self, data: bytes) -> Union[str, bytes]:
+        state = self.decoder.getstate()
+        try:
+            return self.decoder.decode(data)
+        except UnicodeDecodeError:
+            self.decode_errors += 1
+            if self.errors == 'raw':
+                self.decoder.reset()
+                return state[0] + data
+            self.fallback.setstate(state)
+            text = self.fallback.decode(data)
+            self.decoder.setstate(self.fallback.getstate())
+            return text
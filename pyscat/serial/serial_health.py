@@ -17,6 +17,7 @@
 
 
 import logging
+import time
 
 from pyscat.config import Config
 from pyscat.devices import Devices
@@ -24,8 +25,10 @@ from pyscat.health import HealthStatus, HealthReport
 from pyscat.serial.serial_properties import SerialProperties
 from pkg_resources import get_distribution, DistributionNotFound
 from pyscat.device_config import DeviceConfig
+from pyscat.device_registry import DeviceRegistry
 from serial import Serial, SerialException
 from pyscat.digi_health import DigiHealth
+from pyscat.digi_telnet import DigiTelnetError
 
 
 def get_version():
@@ -36,18 +39,28 @@ def get_version():
 
 
 class SerialHealthCheck:
+    # live connections by device id, set to SerialConnectionManager.device_serial_connections at startup
+    connections = {}
 
     def __init__(self):
         config = Config()
+        self.health_mode = config.devices_config.serial_health_mode
+        self.idle_timeout = config.devices_config.serial_health_idle_timeout
         self.system_logger = logging.getLogger('system')
-        device_config = DeviceConfig(config.devices_config)
-        self.deviceList: Devices = device_config.read_device_config()
-        
+        if not DeviceRegistry.is_loaded():
+            DeviceConfig(config.devices_config).read_device_config()
+
+    # Devices from the registry so health follows slot mapping changes without reading devices.json
+    @property
+    def deviceList(self) -> Devices:
+        return DeviceRegistry.get().devices
 
     def report_health(self, slot_device_map):
         for key in slot_device_map:
             device = slot_device_map[key]
-            self.system_logger.info(key + '  Connected :' + str(not device.is_error))
+            self.system_logger.info(key + '  Connected :' + str(not device.is_error)
+                                    + '  Decode errors :' + str(device.decoder.decode_errors)
+                                    + '  ' + str(device.stats.to_dict()))
 
     def get_health(self):
         health_status = HealthStatus()
@@ -67,27 +80,59 @@ class SerialHealthCheck:
         health_status.is_healthy = True
         return health_status
 
+    # In reader mode a port with a live reader is reported from what its reader saw, without touching the port.
+    # Ports without a reader, and every port in probe mode, are opened and closed again.
     def get_serial_port_health(self):
         hw_statuses = []
         for device in self.deviceList['devices']:
-            serial_port = device['connectionProperties']['port']
-            hw_status: HealthReport = HealthReport()
-            hw_status.entity = serial_port
-            hw_status.device_id = device['id']
-            if 'baud' in device['connectionProperties'] and device['connectionProperties']['baud']:
-                baud = device['connectionProperties']['baud']
+            connection = self.connections.get(device['id']) if self.health_mode == 'reader' else None
+            if connection is not None:
+                hw_statuses.append(self.get_reader_health(device, connection))
             else:
-                baud = SerialProperties.baud;
+                hw_statuses.append(self.get_probe_health(device))
+        return hw_statuses
 
-            try:
-                ser = Serial(serial_port, baud, timeout=1)
+    # A port is unhealthy when it is closed, failed since it was opened or read nothing for idle_timeout seconds
+    def get_reader_health(self, device, connection):
+        stats = connection.stats.to_dict()
+        stats['decodeErrors'] = connection.decoder.decode_errors
+        hw_status: HealthReport = HealthReport()
+        hw_status.entity = device['connectionProperties']['port']
+        hw_status.device_id = device['id']
+        hw_status.remarks = self.get_reader_remarks(stats)
+        hw_status.is_healthy = hw_status.remarks is None
+        hw_status.metadata = stats
+        return hw_status
+
+    def get_reader_remarks(self, stats):
+        if not stats['open']:
+            return stats['lastError'] or "Serial port is not open"
+        if stats['lastErrorAt'] is not None and stats['lastErrorAt'] >= stats['openedAt']:
+            return stats['lastError']
+        idle = stats['idleSeconds']
+        if idle is None or (stats['lastActivity'] or 0) < stats['openedAt']:
+            idle = time.time() - stats['openedAt']
+        if self.idle_timeout and idle >= self.idle_timeout:
+            return "No data from the serial port for " + str(int(idle)) + " seconds"
+        return None
+
+    def get_probe_health(self, device):
+        serial_port = device['connectionProperties']['port']
+        hw_status: HealthReport = HealthReport()
+        hw_status.entity = serial_port
+        hw_status.device_id = device['id']
+        if 'baud' in device['connectionProperties'] and device['connectionProperties']['baud']:
+            baud = device['connectionProperties']['baud']
+        else:
+            baud = SerialProperties.baud;
+
+        try:
+            with Serial(serial_port, baud, timeout=1) as ser:
                 hw_status.is_healthy = ser.isOpen()
-            except SerialException as e:
-                hw_status.is_healthy = False
-                hw_status.remarks = str(e)
-
-            hw_statuses.append(hw_status)
-        return hw_statuses
+        except SerialException as e:
+            hw_status.is_healthy = False
+            hw_status.remarks = str(e)
+        return hw_status
     
     def get_hw_health(self):
         device_type = self.deviceList.get('deviceType', None)
@@ -97,21 +142,30 @@ class SerialHealthCheck:
             if digi_health.get_is_digi_on_rack():
                 return self.get_digi_health(digi_health,digi_ips)
   
+    # One login per Digi, see DigiHealth.probe_digi
     def get_digi_health(self,digi_health,digi_ips):
         hw_statuses=[]
         count =0
         for digi_ip in digi_ips:
             count=count+1
-            hw_status: HealthReport = HealthReport()
-            hw_status.entity = "Digi Connect"
-            hw_status.device_id = str(count)
-            hw_status.host = digi_ip
-            hw_status.is_healthy = digi_health.check_digi_status(digi_ip)
-            hw_status.is_healthy = True
-            if hw_status.is_healthy:
-                hw_status.version = digi_health.get_digi_version(digi_ip)
-                uptime = digi_health.get_digi_uptime(digi_ip)
-                mac = digi_health.get_digi_mac(digi_ip)
-                hw_status.metadata = dict(list(uptime.items()) + list(mac.items()))
-            hw_statuses.append(hw_status)
-        return hw_statuses
\ No newline at end of file
+            try:
+                probe = digi_health.run(digi_health.probe_digi(digi_ip))
+            except DigiTelnetError as e:
+                probe = {'host': digi_ip, 'isHealthy': False, 'error': str(e)}
+            hw_statuses.append(self.get_digi_report(count, probe))
+        return hw_statuses
+
+    def get_digi_report(self, count, probe):
+        hw_status: HealthReport = HealthReport()
+        hw_status.entity = "Digi Connect"
+        hw_status.device_id = str(count)
+        hw_status.host = probe['host']
+        hw_status.is_healthy = probe['isHealthy']
+        if hw_status.is_healthy:
+            hw_status.version = {"Firmware": probe['version'] or "Unable to fetch"}
+            hw_status.metadata = {"uptime": probe['uptime'] or "unable to fetch",
+                                  "mac": probe['mac'] or "Unable to fetch",
+                                  "firmware": probe['firmware']}
+        else:
+            hw_status.remarks = probe['error']
+        return hw_status
@@ -0,0 +1,118 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+import asyncio
+import logging
+import threading
+
+from pyscat.serial.device_serial import DeviceSerialConnection
+
+
+# Single event loop that watches the file descriptor of every serial port.
+# Ports are read only when the kernel reports them readable, so the number of
+# threads stays constant no matter how many ports are on the rack.
+class SerialIOEngine:
+
+    def __init__(self):
+        self.system_logger = logging.getLogger('system')
+        self.loop = asyncio.new_event_loop()
+        self.thread = None
+        self.tasks = {}
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run_loop, name='serial-io-engine', daemon=False)
+            self.thread.start()
+
+    def run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    # Start watching a device, safe to call from any thread
+    def add_connection(self, connection: DeviceSerialConnection, server):
+        self.start()
+        connection.close_connection = False
+        connection.io_engine = self
+        self.loop.call_soon_threadsafe(self.start_task, connection, server)
+
+    # Stop watching a device, safe to call from any thread
+    def remove_connection(self, connection: DeviceSerialConnection):
+        self.loop.call_soon_threadsafe(self.cancel_task, connection)
+
+    # Apply new serial settings to a watched device on the loop thread, safe to call from any thread
+    def retune_connection(self, connection: DeviceSerialConnection, device):
+        self.loop.call_soon_threadsafe(connection.retune, device)
+
+    def start_task(self, connection: DeviceSerialConnection, server):
+        if connection.close_connection:
+            return
+        self.tasks[connection] = self.loop.create_task(self.serve_connection(connection, server))
+
+    def cancel_task(self, connection: DeviceSerialConnection):
+        task = self.tasks.pop(connection, None)
+        if task is not None:
+            task.cancel()
+
+    # A port without a file descriptor is read by its own thread instead, see DeviceSerialConnection.connect_to_device
+    def use_thread(self, connection: DeviceSerialConnection, server):
+        self.system_logger.info(connection.device['id'] + " has no file descriptor, reading it on a thread")
+        self.tasks.pop(connection, None)
+        connection.io_engine = None
+        connection.connect_to_device(server)
+
+    # Open the port, register its fd with the loop and read whatever is available each time it is readable
+    async def serve_connection(self, connection: DeviceSerialConnection, server):
+        connection.setup_loggers()
+        await server.register_device(connection.device['id'], connection)
+        threaded = False
+        while not connection.close_connection:
+            try:
+                fd = None
+                try:
+                    ser = connection.open_serial(timeout=0)
+                    if not connection.supports_event_loop(ser):
+                        threaded = True
+                        break
+                    fd = ser.fileno()
+                    readable = asyncio.Event()
+                    self.loop.add_reader(fd, readable.set)
+                    while not connection.close_connection:
+                        await readable.wait()
+                        readable.clear()
+                        data = connection.read_available()
+                        lines = connection.split_lines(data)
+                        if connection.read_mode == 'line':
+                            for line in lines:
+                                await connection.handle_lines(server, [line])
+                        elif lines:
+                            await connection.handle_lines(server, lines)
+                finally:
+                    if fd is not None:
+                        self.loop.remove_reader(fd)
+                    connection.close_serial()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:  # try reconnecting
+                self.system_logger.error("error " + repr(e))
+                connection.error_logger.error("error " + repr(e))
+                connection.is_error = True
+                connection.stats.record_error(repr(e))
+                await asyncio.sleep(5)  # retry connection forever
+        if threaded:
+            self.use_thread(connection, server)
@@ -0,0 +1,139 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+import argparse
+import os
+import struct
+import threading
+import time
+import tty
+from typing import BinaryIO, Iterator, Tuple
+
+# Recording file format: MAGIC followed by records of RECORD_HEADER (monotonic_ns, length) and the bytes read
+MAGIC = b'PSCR\x01'
+RECORD_HEADER = struct.Struct('<QI')
+
+
+# Appends everything read from a serial port to a recording, with the time it arrived
+class SerialRecorder:
+
+    def __init__(self, path: str, buffer_size: int = 65536):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.file = open(path, 'wb', buffering=buffer_size)
+        self.file.write(MAGIC)
+
+    def write(self, data: bytes) -> None:
+        self.file.write(RECORD_HEADER.pack(time.monotonic_ns(), len(data)))
+        self.file.write(data)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def read_records(f: BinaryIO) -> Iterator[Tuple[int, bytes]]:
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a serial recording " + f.name)
+    while True:
+        header = f.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        timestamp, length = RECORD_HEADER.unpack(header)
+        yield timestamp, f.read(length)
+
+
+# Plays a recording into a pseudo terminal so it can stand in for a serial port.
+# speed 1 keeps the recorded timing, 10 plays ten times faster and 0 as fast as the reader takes it.
+# With repeat the recording is played over and over, which makes it a repeatable load generator.
+class SerialReplay:
+
+    def __init__(self, path: str, speed: float = 1, repeat: bool = False):
+        self.path = path
+        self.speed = speed
+        self.repeat = repeat
+        self.stopped = threading.Event()
+        self.thread = None
+        self.master, self.slave = os.openpty()
+        try:
+            tty.setraw(self.slave)
+            self.port = os.ttyname(self.slave)
+        except OSError:
+            self.stop()
+            raise
+
+    def start(self) -> str:
+        self.thread = threading.Thread(target=self.run, name='serial-replay', daemon=True)
+        self.thread.start()
+        return self.port
+
+    def run(self):
+        try:
+            with open(self.path, 'rb') as f:
+                while not self.stopped.is_set():
+                    self.play(f)
+                    if not self.repeat:
+                        break
+                    f.seek(0)
+        except OSError:
+            pass  # port closed while writing
+
+    def play(self, f: BinaryIO):
+        started = time.monotonic_ns()
+        first = None
+        for timestamp, data in read_records(f):
+            if self.stopped.is_set():
+                return
+            if first is None:
+                first = timestamp
+            if self.speed:
+                delay = (started + (timestamp - first) / self.speed - time.monotonic_ns()) / 1e9
+                if delay > 0 and self.stopped.wait(delay):
+                    return
+            view = memoryview(data)
+            while view:
+                view = view[os.write(self.master, view):]
+
+    def stop(self):
+        self.stopped.set()
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+# Replay a recording on a pseudo terminal, point a device's port at the printed path
+def main():
+    parser = argparse.ArgumentParser(description='Replay a serial recording on a pseudo terminal')
+    parser.add_argument('recording')
+    parser.add_argument('--speed', type=float, default=1, help='1 recorded timing, 10 ten times faster, 0 max speed')
+    parser.add_argument('--repeat', action='store_true', help='play the recording over and over')
+    args = parser.parse_args()
+    replay = SerialReplay(args.recording, args.speed, args.repeat)
+    print(replay.port, flush=True)
+    replay.start()
+    try:
+        replay.thread.join()
+    except KeyboardInterrupt:
+        pass
+    replay.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+import time
+
+
+# Health of a serial connection as seen by its reader: whether the port is open, when it last read,
+# read rates, reconnects and the last error. Updated by the read loop in constant time and read by the
+# health check without touching the port. Rates are measured over windows of window seconds.
+class SerialConnectionStats:
+    window: float = 10
+
+    def __init__(self):
+        self.is_open = False
+        self.opened_at = None
+        self.opens = 0
+        self.last_activity = None
+        self.bytes_read = 0
+        self.lines_read = 0
+        self.last_error = None
+        self.last_error_at = None
+        self.window_start = time.monotonic()
+        self.window_bytes = 0
+        self.window_lines = 0
+        self.bytes_per_second = 0.0
+        self.lines_per_second = 0.0
+
+    def opened(self):
+        self.is_open = True
+        self.opened_at = time.time()
+        self.opens += 1
+
+    def closed(self):
+        self.is_open = False
+
+    def record_bytes(self, count: int):
+        self.bytes_read += count
+        self.last_activity = time.time()
+        self.roll_window()
+
+    def record_lines(self, count: int):
+        self.lines_read += count
+
+    def record_error(self, error: str):
+        self.last_error = error
+        self.last_error_at = time.time()
+
+    # Close the current window once it is window seconds old and keep its rates
+    def roll_window(self):
+        now = time.monotonic()
+        elapsed = now - self.window_start
+        if elapsed >= self.window:
+            self.bytes_per_second = (self.bytes_read - self.window_bytes) / elapsed
+            self.lines_per_second = (self.lines_read - self.window_lines) / elapsed
+            self.window_start = now
+            self.window_bytes = self.bytes_read
+            self.window_lines = self.lines_read
+
+    # Reconnects are opens after the first
+    def get_reconnects(self):
+        return max(self.opens - 1, 0)
+
+    def to_dict(self):
+        self.roll_window()
+        now = time.time()
+        return {'open': self.is_open,
+                'openedAt': self.opened_at,
+                'lastActivity': self.last_activity,
+                'idleSeconds': round(now - self.last_activity, 3) if self.last_activity else None,
+                'bytesRead': self.bytes_read,
+                'linesRead': self.lines_read,
+                'bytesPerSecond': round(self.bytes_per_second, 1),
+                'linesPerSecond': round(self.lines_per_second, 1),
+                'reconnects': self.get_reconnects(),
+                'lastError': self.last_error,
+                'lastErrorAt': self.last_error_at}
@@ -0,0 +1,138 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+import copy
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+from pyscat.device_config import DeviceConfig
+from pyscat.devices import Devices
+
+
+# Applies slot mapping changes from the REST endpoints on a single thread.
+# Changes submitted within debounce seconds of each other (but no longer than max_delay after the first one)
+# are applied to one copy of the devices, written to devices.json once and handed to the connection manager once.
+# A change that fails validation fails only its own request, the rest of the batch is still applied.
+# Every request gets a future that resolves when its batch has been applied.
+# A reload (see ConfigWatcher) applies devices.json as it is on disk and goes through the same queue, so
+# update_devices never runs twice at the same time.
+class SlotMappingQueue:
+
+    def __init__(self, device_config: DeviceConfig, serial_connection_manager, debounce: float, max_delay: float):
+        self.device_config = device_config
+        self.serial_connection_manager = serial_connection_manager
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.system_logger = logging.getLogger('system')
+        self.condition = threading.Condition()
+        self.pending = []
+        self.last_submit = 0
+        self.batches = 0
+        self.applied = 0
+        self.thread = threading.Thread(target=self.run, name='slot-mapping-queue', daemon=True)
+        self.thread.start()
+
+    # Queue a change, a function that takes the devices and returns the updated devices.
+    # Safe to call from any thread, the returned future resolves with the batch result or the change's error
+    def submit(self, change: Callable[[Devices], Devices]) -> Future:
+        future = Future()
+        with self.condition:
+            self.pending.append((change, future))
+            self.last_submit = time.monotonic()
+            self.condition.notify()
+        return future
+
+    # Apply devices.json as it is on disk without writing it
+    def submit_reload(self) -> Future:
+        return self.submit(None)
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            try:
+                self.apply_batch(batch)
+            except Exception as e:
+                # e.g. devices.json missing or unreadable. The batch fails, the thread keeps going and the next
+                # batch reads devices.json again, an unresolved future would hang its request forever
+                self.system_logger.error("Slot mapping update failed " + repr(e))
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    # Wait for the first change, then until no change arrived for debounce seconds or max_delay has passed
+    def next_batch(self):
+        with self.condition:
+            while not self.pending:
+                self.condition.wait()
+            first = time.monotonic()
+            while True:
+                now = time.monotonic()
+                timeout = min(self.last_submit + self.debounce, first + self.max_delay) - now
+                if timeout <= 0:
+                    break
+                self.condition.wait(timeout)
+            batch = self.pending
+            self.pending = []
+            return batch
+
+    def apply_batch(self, batch):
+        start = time.monotonic()
+        devices = copy.deepcopy(self.device_config.get_config())
+        accepted = []
+        applied = 0
+        for change, future in batch:
+            if change is None:
+                accepted.append(future)
+                continue
+            try:
+                # applied to a copy of the device list and validated, an invalid change leaves devices untouched
+                updated = change(dict(devices, devices=list(devices['devices'])))
+                DeviceConfig.validate_devices(updated)
+                devices = updated
+                accepted.append(future)
+                applied += 1
+            except Exception as e:
+                future.set_exception(e)
+        if not accepted:
+            return
+        try:
+            if applied:
+                self.device_config.write_device_config(devices)
+            changes = self.serial_connection_manager.update_devices(self.device_config.read_device_config())
+        except Exception as e:
+            self.system_logger.error("Slot mapping update failed " + repr(e))
+            for future in accepted:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.applied += applied
+        # batchSize counts the changes written together, rejected the changes of the batch that failed validation
+        result = {'success': True, 'batchSize': applied, 'rejected': len(batch) - len(accepted), 'changes': changes}
+        self.system_logger.info("Applied " + str(applied) + " slot mapping changes in "
+                                + str(round((time.monotonic() - start) * 1000, 1)) + "ms")
+        for future in accepted:
+            future.set_result(result)
+
+    def stats(self):
+        with self.condition:
+            queued = len(self.pending)
+        return {'queued': queued, 'batches': self.batches, 'applied': self.applied}
@@ -0,0 +1,172 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+import argparse
+import asyncio
+import socket
+import struct
+
+IAC = 255
+WILL = 251
+ECHO = 1
+SUPPRESS_GO_AHEAD = 3
+
+# Command output of the firmware families SCAT talks to, see DigiHealth
+FIRMWARE = {
+    'portserver': {
+        'prompt': '#> ',
+        'commands': {
+            'show versions': "\nDevice Versions Information :\n\n"
+                             "    Model             : PortServer TS 16\n"
+                             "    Firmware          : Version 82000747_Z1 10/22/2019\n"
+                             "    Boot              : Version 82000770_F 01/12/2011\n"
+                             "    POST              : Version 82000771_C 01/12/2011\n"
+                             "    Factory           : release_82000747_Z1\n",
+            'uptime': "\nSystem Uptime Information :\n\n"
+                      "    Current Time      : Fri Oct 16 10:00:00 2026\n"
+                      "    Time since reboot: 3 days, 04:05:06\n",
+            'show config': "\nNetwork Configuration :\n\n"
+                           "    ip address        : 192.168.100.50\n"
+                           "    mac address       : 00:40:9D:12:34:56\n",
+            'set profile profile=realport port=1-32': "",
+            'show profile': "\nport  profile\n1-32  realport\n",
+            'boot action=reset': "\nrebooting...\n",
+        },
+    },
+    'connectit': {
+        'prompt': '> ',
+        'commands': {
+            'display device': "\n Device Information\n -------------------\n"
+                              " Model            : Digi Connect IT 16\n"
+                              " Serial number    : CIT-000123\n"
+                              " firmware version : 22.11.48.62\n"
+                              " Bootloader       : 19.7.23.0\n"
+                              " MAC              : 00:40:FF:AB:CD:EF\n"
+                              " Uptime           : 5 Days, 2 Hours, 3 Minutes, 4 Seconds\n",
+            'set profile profile=realport port=1-32': "Error: invalid argument 'port'\n",
+            'set profile profile=realport range=1-4': "",
+            'show profile': "error: unknown command\n",
+            'boot action=reset': "\nThe system is going down for reboot NOW!\n",
+        },
+    },
+}
+
+
+# Telnet server that behaves like the command line of a Digi, for trying pyscat without a rack.
+# It negotiates echo like a Digi, asks for login and password, answers the commands of its firmware profile
+# after delay seconds and closes the connection on reboot, or resets it without an answer with reset.
+class FakeDigiServer:
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, firmware: str = 'portserver',
+                 username: str = 'root', password: str = 'dbps', delay: float = 0, reset: bool = False):
+        self.host = host
+        self.port = port
+        self.firmware = FIRMWARE[firmware]
+        self.username = username
+        self.password = password
+        self.delay = delay
+        self.reset = reset
+        self.server: asyncio.AbstractServer = None
+        self.logins = 0
+        self.commands = []
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def read_line(self, reader: asyncio.StreamReader):
+        line = await reader.readline()
+        if not line:
+            raise ConnectionResetError
+        # skip the option replies of the client
+        while line and line[0] == IAC:
+            line = line[3:]
+        return line.decode('ascii', 'replace').strip()
+
+    # Close the connection with a reset instead of a FIN
+    @staticmethod
+    def abort(writer: asyncio.StreamWriter):
+        writer.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        writer.transport.abort()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        prompt = self.firmware['prompt']
+        try:
+            writer.write(bytes((IAC, WILL, ECHO, IAC, WILL, SUPPRESS_GO_AHEAD)))
+            writer.write(b"\r\nlogin: ")
+            while True:
+                username = await self.read_line(reader)
+                writer.write(username.encode() + b"\r\npassword: ")
+                password = await self.read_line(reader)
+                await asyncio.sleep(self.delay)
+                if username == self.username and password == self.password:
+                    break
+                writer.write(b"\r\nLogin incorrect\r\nlogin: ")
+            self.logins += 1
+            writer.write(b"\r\n" + prompt.encode())
+            while True:
+                command = await self.read_line(reader)
+                self.commands.append(command)
+                await asyncio.sleep(self.delay)
+                if command == 'boot action=reset' and self.reset:
+                    self.abort(writer)
+                    break
+                output = self.firmware['commands'].get(command)
+                if output is None:
+                    output = "Error: unknown command '" + command + "'\n"
+                writer.write((command + "\n" + output).replace("\n", "\r\n").encode())
+                if command == 'boot action=reset':
+                    break
+                writer.write(prompt.encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass  # client gone or server stopped while a delayed answer was pending
+        finally:
+            writer.close()
+
+
+async def serve(args):
+    servers = [await FakeDigiServer(args.host, args.port + i if args.port else 0, args.firmware,
+                                    args.username, args.password, args.delay).start() for i in range(args.count)]
+    for server in servers:
+        print(server.host + ":" + str(server.port), flush=True)
+    await asyncio.Event().wait()
+
+
+# python -m pyscat.tests.fake_digi --port 2323 --count 4 --firmware connectit --delay 0.2
+def main():
+    parser = argparse.ArgumentParser(description='Fake Digi telnet server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--count', type=int, default=1)
+    parser.add_argument('--firmware', choices=FIRMWARE.keys(), default='portserver')
+    parser.add_argument('--username', default='root')
+    parser.add_argument('--password', default='dbps')
+    parser.add_argument('--delay', type=float, default=0)
+    args = parser.parse_args()
+    asyncio.run(serve(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+'''
+Description:
+    Tests for validating and applying a bulk slot mapping
+Command:
+    pytest -v pyscat/tests/test_bulk_slot_mapping.py
+'''
+import unittest
+
+from pyscat.config import Config
+from pyscat.device_config import DeviceConfig, SlotMappingError, MAX_DEVICES_PER_SLOT, MAX_SLOT
+
+
+class BulkSlotMappingTest(unittest.TestCase):
+    '''
+    DeviceConfig.parse_bulk_slot_mapping Test
+    '''
+
+    def setUp(self) -> None:
+        self.device_config = DeviceConfig(Config().devices_config)
+
+    def test_parse_slots(self):
+        '''Single mappings, lists and baud rates become devices per slot number'''
+        slot_devices = self.device_config.parse_bulk_slot_mapping({'1': '1:2', '3': ['2:1', '2:2:9600'], '4': ''})
+        assert slot_devices[1] == [{'id': '000000000001', 'type': 'DTA', 'connectionProperties': {'port': '/dev/ttyO001'}}]
+        assert slot_devices[3] == [
+            {'id': '000000000003', 'type': 'DTA', 'connectionProperties': {'port': '/dev/ttyO100'}},
+            {'id': '000000010003', 'type': 'DTA', 'connectionProperties': {'port': '/dev/ttyO101', 'baud': 9600}}]
+        assert slot_devices[4] == []
+
+    def test_collects_every_error(self):
+        '''Every invalid slot is reported at once'''
+        with self.assertRaises(SlotMappingError) as context:
+            self.device_config.parse_bulk_slot_mapping({
+                '1': '1:1',
+                'x': '1:2',
+                str(MAX_SLOT + 1): '1:3',
+                '5': ['1:4'] * (MAX_DEVICES_PER_SLOT + 1),
+                '6': '1-5',
+                '7': '0:1',
+            })
+        errors = context.exception.errors
+        assert sorted(errors) == sorted(['x', str(MAX_SLOT + 1), '5', '6', '7'])
+        assert errors['x'] == 'Invalid slot x'
+        assert errors[str(MAX_SLOT + 1)] == 'Slot must be between 0 and ' + str(MAX_SLOT)
+        assert errors['5'] == 'At most ' + str(MAX_DEVICES_PER_SLOT) + ' devices per slot'
+        assert errors['6'].startswith('Invalid mapping 1-5')
+        assert isinstance(context.exception, ValueError)
+
+    def test_invalid_format(self):
+        '''Slots that are not an object are rejected'''
+        with self.assertRaises(ValueError):
+            self.device_config.parse_bulk_slot_mapping(['1:1'])
+
+    def test_set_bulk_slot_devices(self):
+        '''Mapped slots are replaced, empty slots removed and other slots kept'''
+        devices = {'devices': []}
+        self.device_config.set_bulk_slot_devices(
+            devices, self.device_config.parse_bulk_slot_mapping({'1': '1:1', '2': ['1:2', '1:3'], '3': '1:4'}))
+        self.device_config.set_bulk_slot_devices(
+            devices, self.device_config.parse_bulk_slot_mapping({'2': '2:1', '3': None}))
+        assert [(device['id'], device['connectionProperties']['port']) for device in devices['devices']] == [
+            ('000000000001', '/dev/ttyO000'), ('000000000002', '/dev/ttyO100')]
+        DeviceConfig.validate_devices(devices)
@@ -0,0 +1,113 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+'''
+Description:
+    Tests for the bounded send queue of a websocket client
+Command:
+    pytest -v pyscat/tests/test_client_queue.py
+'''
+import asyncio
+import unittest
+
+from pyscat.client_queue import WebSocketClientQueue
+
+
+class SlowWebSocket:
+    '''Websocket that only sends once released'''
+
+    def __init__(self):
+        self.remote_address = ('127.0.0.1', 40000)
+        self.released = asyncio.Event()
+        self.sent = []
+        self.close_code = None
+
+    async def send(self, message):
+        await self.released.wait()
+        self.sent.append(message)
+
+    async def close(self, code, reason):
+        self.close_code = code
+
+
+class WebSocketClientQueueTest(unittest.IsolatedAsyncioTestCase):
+    '''
+    WebSocketClientQueue Test
+    '''
+
+    async def drain(self, client, ws):
+        ws.released.set()
+        client.wake()
+        for _ in range(100):
+            await asyncio.sleep(0)
+
+    async def test_drop_oldest(self):
+        '''A full queue discards its oldest messages'''
+        ws = SlowWebSocket()
+        client = WebSocketClientQueue(ws, 3, 'drop_oldest')
+        client.put(['1', '2', '3', '4', '5'])
+        assert [message for _, message in client.queue] == ['3', '4', '5']
+        assert client.dropped == 2
+        client.start()
+        await self.drain(client, ws)
+        assert ws.sent == ['3', '4', '5']
+        assert client.stats()['sent'] == 3
+        client.stop()
+
+    async def test_drop_newest(self):
+        '''A full queue discards the incoming messages'''
+        ws = SlowWebSocket()
+        client = WebSocketClientQueue(ws, 3, 'drop_newest')
+        client.put(['1', '2', '3', '4', '5'])
+        assert [message for _, message in client.queue] == ['1', '2', '3']
+        assert client.dropped == 2
+        client.start()
+        await self.drain(client, ws)
+        assert ws.sent == ['1', '2', '3']
+        client.stop()
+
+    async def test_disconnect(self):
+        '''A full queue closes the connection of the slow client'''
+        ws = SlowWebSocket()
+        client = WebSocketClientQueue(ws, 3, 'disconnect')
+        client.put(['1', '2', '3', '4', '5'])
+        assert client.overflowed
+        assert client.dropped == 1
+        client.start()
+        await self.drain(client, ws)
+        assert ws.close_code == 1008
+        assert not client.is_writable()
+
+    async def test_put_never_waits_for_the_client(self):
+        '''Messages are queued from another thread while the client is blocked'''
+        ws = SlowWebSocket()
+        client = WebSocketClientQueue(ws, 1000, 'drop_oldest')
+        client.start()
+        await asyncio.to_thread(client.put, [str(i) for i in range(500)])
+        await asyncio.sleep(0)
+        assert client.sending and not client.is_writable()
+        assert ws.sent == []
+        await self.drain(client, ws)
+        assert ws.sent == [str(i) for i in range(500)]
+        client.stop()
+
+    def test_invalid_policy(self):
+        '''An unknown overflow policy is rejected'''
+        with self.assertRaises(ValueError):
+            WebSocketClientQueue(SlowWebSocket(), 10, 'block')
@@ -0,0 +1,64 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+'''
+Description:
+    Tests for running Digi operations on every Digi of a rack in parallel
+Command:
+    pytest -v pyscat/tests/test_digi_operations.py
+'''
+import asyncio
+import unittest
+
+from pyscat.config import Config
+from pyscat.digi_operations import DigiOperationRunner
+from pyscat.digi_telnet import DigiTelnetError
+
+HOSTS = ['192.168.100.%d' % i for i in range(50, 60)]
+
+
+async def slow_action(host):
+    await asyncio.sleep(0.2)
+    if host == HOSTS[-1]:
+        raise DigiTelnetError(host + " did not reboot")
+    return True
+
+
+class DigiOperationRunnerTest(unittest.IsolatedAsyncioTestCase):
+    '''
+    DigiOperationRunner Test
+    '''
+
+    async def run_operation(self, concurrency: int):
+        runner = DigiOperationRunner(concurrency)
+        operation = runner.start('reboot', HOSTS, slow_action)
+        await asyncio.wait_for(operation.done.wait(), 5)
+        return operation
+
+    async def test_whole_rack_at_once(self):
+        '''By default a 10 Digi rack takes the time of its slowest Digi'''
+        operation = await self.run_operation(Config().devices_config.digi_concurrency)
+        assert operation.duration < 0.4
+        assert operation.get_status() == 'failed'
+        assert [result['status'] for result in operation.results.values()] == ['done'] * 9 + ['failed']
+
+    async def test_concurrency_limit(self):
+        '''A concurrency above 0 works on that many Digis at a time'''
+        operation = await self.run_operation(5)
+        assert 0.4 <= operation.duration < 0.6
@@ -0,0 +1,113 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+'''
+Description:
+    Tests for telling Digi firmware apart and parsing its probe output
+Command:
+    pytest -v pyscat/tests/test_digi_probe.py
+'''
+import unittest
+from unittest.mock import patch
+
+from pyscat.digi_health import DigiHealth
+from pyscat.digi_probe import CONNECTIT, PORTSERVER, detect_firmware, parse_probe
+from pyscat.digi_telnet import DigiTelnetClient
+from pyscat.tests.fake_digi import FIRMWARE, FakeDigiServer
+
+
+def firmware_output(firmware: str) -> str:
+    commands = FIRMWARE[firmware]['commands']
+    return '\n'.join(commands[command] for command in (PORTSERVER if firmware == 'portserver' else CONNECTIT).commands)
+
+
+class DigiProbeTest(unittest.TestCase):
+    '''
+    detect_firmware and parse_probe Test
+    '''
+
+    def test_detect_firmware(self):
+        '''The output of show versions tells the firmware families apart'''
+        assert detect_firmware(FIRMWARE['portserver']['commands']['show versions']) is PORTSERVER
+        assert detect_firmware("Error: unknown command 'show versions'\n") is CONNECTIT
+        assert detect_firmware(FIRMWARE['connectit']['commands']['display device']) is CONNECTIT
+        assert detect_firmware('') is PORTSERVER
+
+    def test_parse_portserver(self):
+        '''Version, uptime and MAC of a PortServer'''
+        assert parse_probe(PORTSERVER, firmware_output('portserver')) == {
+            'firmware': 'portserver', 'version': '82000747_Z1', 'uptime': '3 days, 04:05:06',
+            'mac': '00:40:9D:12:34:56'}
+
+    def test_parse_connectit(self):
+        '''Version, uptime and MAC of a Connect IT'''
+        assert parse_probe(CONNECTIT, firmware_output('connectit')) == {
+            'firmware': 'connectit', 'version': '22.11.48.62', 'uptime': '5 Days, 2 Hours, 3 Minutes, 4 Seconds',
+            'mac': '00:40:FF:AB:CD:EF'}
+
+    def test_parse_other_firmware_patterns(self):
+        '''Values the detected firmware cannot find are taken from the patterns of the other families'''
+        result = parse_probe(PORTSERVER, firmware_output('connectit'))
+        assert result['version'] == '22.11.48.62'
+        assert result['uptime'] == '5 Days, 2 Hours, 3 Minutes, 4 Seconds'
+
+    def test_parse_nothing(self):
+        '''Missing values are None'''
+        assert parse_probe(PORTSERVER, 'nothing here') == {'firmware': 'portserver', 'version': None,
+                                                           'uptime': None, 'mac': None}
+
+
+class DigiHealthProbeTest(unittest.IsolatedAsyncioTestCase):
+    '''
+    DigiHealth.probe_digi Test
+    '''
+
+    async def start_fake(self, **kwargs) -> FakeDigiServer:
+        fake = await FakeDigiServer(**kwargs).start()
+        self.addAsyncCleanup(fake.stop)
+        return fake
+
+    def patch_client(self, fake: FakeDigiServer):
+        client = DigiTelnetClient(fake.host, fake.username, fake.password, port=fake.port)
+        return patch.object(DigiHealth, 'get_client', return_value=client)
+
+    async def probe(self, firmware: str) -> dict:
+        fake = await self.start_fake(firmware=firmware)
+        with self.patch_client(fake):
+            result = await DigiHealth().probe_digi(fake.host)
+        return result, fake
+
+    async def test_probe_portserver(self):
+        '''A PortServer is probed with its three commands in one login'''
+        result, fake = await self.probe('portserver')
+        assert fake.logins == 1
+        assert fake.commands == list(PORTSERVER.commands)
+        assert result['isHealthy'] and result['version'] == '82000747_Z1' and result['mac'] == '00:40:9D:12:34:56'
+
+    async def test_probe_connectit(self):
+        '''A Connect IT is told apart by its answer to show versions and probed with display device'''
+        result, fake = await self.probe('connectit')
+        assert fake.commands == ['show versions', 'display device']
+        assert result['firmware'] == 'connectit' and result['version'] == '22.11.48.62'
+
+    async def test_reboot_reset(self):
+        '''A Digi that resets the connection on reboot is rebooting, not failed'''
+        fake = await self.start_fake(reset=True)
+        with self.patch_client(fake):
+            assert await DigiHealth().reboot_digi(fake.host)
@@ -0,0 +1,125 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+'''
+Description:
+    Tests for the Digi telnet client against the fake Digi
+Command:
+    pytest -v pyscat/tests/test_digi_telnet.py
+'''
+import asyncio
+import re
+import unittest
+
+from pyscat.digi_telnet import DigiTelnetClient, DigiTelnetError
+from pyscat.tests.fake_digi import FakeDigiServer
+
+
+class DigiTelnetClientTest(unittest.IsolatedAsyncioTestCase):
+    '''
+    DigiTelnetClient Test
+    '''
+
+    async def start_fake(self, **kwargs) -> FakeDigiServer:
+        fake = await FakeDigiServer(**kwargs).start()
+        self.addAsyncCleanup(fake.stop)
+        return fake
+
+    def client(self, fake: FakeDigiServer, password: str = 'dbps', **kwargs) -> DigiTelnetClient:
+        return DigiTelnetClient(fake.host, 'root', password, port=fake.port, **kwargs)
+
+    async def test_command_waits_for_prompt(self):
+        '''A command returns once the delayed prompt arrives, without the echo and the prompt'''
+        fake = await self.start_fake(delay=0.3)
+        async with self.client(fake, login_timeout=2, command_timeout=2) as client:
+            output = await client.command('show config')
+        assert fake.logins == 1
+        assert fake.commands == ['show config']
+        assert 'mac address       : 00:40:9D:12:34:56' in output
+        assert 'show config' not in output
+        assert not output.rstrip().endswith('#>')
+
+    async def test_command_timeout(self):
+        '''A command that takes longer than its timeout fails'''
+        fake = await self.start_fake()
+        async with self.client(fake, command_timeout=0.2) as client:
+            fake.delay = 1
+            with self.assertRaisesRegex(DigiTelnetError, 'timed out waiting for uptime'):
+                await client.command('uptime')
+
+    async def test_login_timeout(self):
+        '''A Digi that does not answer the login in time fails'''
+        fake = await self.start_fake(delay=1)
+        with self.assertRaisesRegex(DigiTelnetError, 'timed out waiting for shell prompt'):
+            async with self.client(fake, login_timeout=0.2):
+                pass
+
+    async def test_login_failure(self):
+        '''A wrong password fails the login instead of waiting for the shell'''
+        fake = await self.start_fake()
+        with self.assertRaisesRegex(DigiTelnetError, 'Login to 127.0.0.1 failed'):
+            async with self.client(fake, password='wrong', login_timeout=2):
+                pass
+        assert fake.logins == 0
+
+    async def test_connection_refused(self):
+        '''A Digi that cannot be reached fails to connect'''
+        fake = await FakeDigiServer().start()
+        await fake.stop()
+        with self.assertRaisesRegex(DigiTelnetError, 'Unable to connect to 127.0.0.1'):
+            async with self.client(fake):
+                pass
+
+    async def test_reboot(self):
+        '''A reboot returns what the Digi printed before it closed the connection'''
+        fake = await self.start_fake(firmware='connectit')
+        async with self.client(fake, command_timeout=2) as client:
+            output = await client.command_until_closed('boot action=reset', re.compile(r'rebooting|going down'))
+        assert 'going down' in output
+        assert fake.commands == ['boot action=reset']
+
+    async def test_reset_during_login(self):
+        '''A Digi that resets the connection fails with a DigiTelnetError'''
+        async def reset_after_login_prompt(reader, writer):
+            writer.write(b"login: ")
+            await reader.readline()
+            FakeDigiServer.abort(writer)
+
+        server = await asyncio.start_server(reset_after_login_prompt, '127.0.0.1', 0)
+        self.addAsyncCleanup(server.wait_closed)
+        self.addCleanup(server.close)
+        client = DigiTelnetClient('127.0.0.1', 'root', 'dbps', port=server.sockets[0].getsockname()[1],
+                                  login_timeout=2)
+        with self.assertRaisesRegex(DigiTelnetError, 'connection failed waiting for password prompt'):
+            async with client:
+                pass
+
+    async def test_reboot_reset(self):
+        '''A Digi that resets the connection on reboot is rebooting'''
+        fake = await self.start_fake(reset=True)
+        async with self.client(fake, command_timeout=2) as client:
+            output = await client.command_until_closed('boot action=reset', re.compile(r'rebooting'))
+        assert output == ''
+        assert client.eof
+
+    def test_negotiate(self):
+        '''Telnet options are refused and split commands are kept for the next read'''
+        client = DigiTelnetClient('127.0.0.1', 'root', 'dbps')
+        assert client.negotiate(b'log\xff\xfb') == b'log'
+        assert client.negotiate(b'\x01in: \xff\xff') == b'in: \xff'
@@ -0,0 +1,96 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+'''
+Description:
+    Tests for applying a new device list to the running serial connections
+Command:
+    pytest -v pyscat/tests/test_serial_connection_manager.py
+'''
+import copy
+import unittest
+from unittest import mock
+
+from pyscat.serial.device_serial import DeviceSerialConnection
+from pyscat.serial.serial_connection_manager import SerialConnectionManager
+
+
+def make_device(slot: int, port: str, baud: int = None):
+    device = {'id': '%012X' % slot, 'type': 'DTA', 'connectionProperties': {'port': port}}
+    if baud is not None:
+        device['connectionProperties']['baud'] = baud
+    return device
+
+
+class SerialConnectionManagerTest(unittest.TestCase):
+    '''
+    SerialConnectionManager.update_devices Test
+    '''
+
+    def setUp(self) -> None:
+        # connections are tracked without starting readers or opening ports
+        patcher = mock.patch.object(DeviceSerialConnection, 'connect_to_device')
+        self.connect = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.devices = {'devices': [make_device(1, '/dev/ttyO000'), make_device(2, '/dev/ttyO001'),
+                                    make_device(3, '/dev/ttyO002'), make_device(4, '/dev/ttyO003')]}
+        self.manager = SerialConnectionManager(self.devices, server=None)
+        self.manager.io_engine = None
+        self.manager.connect_to_devices()
+        self.connections = dict(self.manager.device_serial_connections)
+
+    def test_diff(self):
+        '''Only added, removed and changed devices are touched'''
+        devices = copy.deepcopy(self.devices)
+        devices['devices'][1]['connectionProperties']['baud'] = 9600
+        devices['devices'][2]['connectionProperties']['port'] = '/dev/ttyO010'
+        del devices['devices'][3]
+        devices['devices'].append(make_device(5, '/dev/ttyO004'))
+        self.connect.reset_mock()
+
+        changes = self.manager.update_devices(devices)
+
+        assert changes == {'added': ['000000000005'], 'removed': ['000000000004'],
+                           'retuned': ['000000000002'], 'restarted': ['000000000003']}
+        connections = self.manager.device_serial_connections
+        assert connections['000000000001'] is self.connections['000000000001']
+        assert connections['000000000002'] is self.connections['000000000002']
+        assert connections['000000000002'].properties.baud == 9600
+        assert connections['000000000003'] is not self.connections['000000000003']
+        assert self.connections['000000000003'].close_connection
+        assert self.connections['000000000004'].close_connection
+        assert '000000000004' not in connections
+        assert self.connect.call_count == 2
+
+    def test_unchanged(self):
+        '''The same device list changes nothing'''
+        self.connect.reset_mock()
+        changes = self.manager.update_devices(copy.deepcopy(self.devices))
+        assert changes == {'added': [], 'removed': [], 'retuned': [], 'restarted': []}
+        assert self.manager.device_serial_connections == self.connections
+        self.connect.assert_not_called()
+
+    def test_serial_settings_are_retuned(self):
+        '''New serial settings are applied to the open port'''
+        devices = copy.deepcopy(self.devices)
+        devices['devices'][0]['connectionProperties'].update({'parity': 'E', 'stop_bits': 2})
+        changes = self.manager.update_devices(devices)
+        assert changes['retuned'] == ['000000000001']
+        assert not self.connections['000000000001'].close_connection
+        assert self.connections['000000000001'].properties.parity == 'E'
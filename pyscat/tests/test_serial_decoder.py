@@ -0,0 +1,75 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+'''
+Description:
+    Tests for the incremental serial decoder
+Command:
+    pytest -v pyscat/tests/test_serial_decoder.py
+'''
+import unittest
+
+from pyscat.serial.serial_decoder import SerialDecoder
+
+
+class SerialDecoderTest(unittest.TestCase):
+    '''
+    SerialDecoder Test
+    '''
+
+    def test_multi_byte_sequence_split_across_reads(self):
+        '''A character split across two reads is decoded once both halves arrived'''
+        decoder = SerialDecoder()
+        data = 'température\n'.encode('utf-8')
+        split = data.index(b'\xc3') + 1
+        assert decoder.decode(data[:split]) == 'temp'
+        assert decoder.decode(data[split:]) == 'érature\n'
+        assert decoder.decode_errors == 0
+
+    def test_replace(self):
+        '''Invalid bytes are replaced with U+FFFD and counted'''
+        decoder = SerialDecoder('replace')
+        assert decoder.decode(b'bad \xff byte\n') == 'bad � byte\n'
+        assert decoder.decode_errors == 1
+
+    def test_backslashreplace(self):
+        '''Invalid bytes are escaped'''
+        decoder = SerialDecoder('backslashreplace')
+        assert decoder.decode(b'bad \xff byte\n') == 'bad \\xff byte\n'
+        assert decoder.decode_errors == 1
+
+    def test_raw(self):
+        '''With raw a line with invalid bytes is passed through as bytes, with the pending partial sequence'''
+        decoder = SerialDecoder('raw')
+        assert decoder.decode(b'ok \xc3') == 'ok '
+        assert decoder.decode(b'\xff\n') == b'\xc3\xff\n'
+        assert decoder.decode_errors == 1
+        assert decoder.decode('é\n'.encode('utf-8')) == 'é\n'
+
+    def test_recovers_after_error(self):
+        '''The decoder keeps decoding valid lines after an invalid one'''
+        decoder = SerialDecoder('replace')
+        decoder.decode(b'\xff\n')
+        assert decoder.decode('ünïcode\n'.encode('utf-8')) == 'ünïcode\n'
+        assert decoder.decode_errors == 1
+
+    def test_invalid_policy(self):
+        '''An unknown policy is rejected'''
+        with self.assertRaises(ValueError):
+            SerialDecoder('ignore')
@@ -0,0 +1,108 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+'''
+Description:
+    Tests for serial recordings and their replay on a pseudo terminal
+Command:
+    pytest -v pyscat/tests/test_serial_recording.py
+'''
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import serial
+
+from pyscat.serial.device_serial import DeviceSerialConnection
+from pyscat.serial.serial_recording import SerialRecorder, SerialReplay, read_records
+
+CHUNKS = [b'first line\r\n', b'partial ', b'line\r\n', bytes(range(256))]
+
+
+class SerialRecordingTest(unittest.TestCase):
+    '''
+    SerialRecorder and SerialReplay Test
+    '''
+
+    def setUp(self) -> None:
+        self.path = os.path.join(tempfile.mkdtemp(), 'recordings', 'slot.rec')
+        recorder = SerialRecorder(self.path)
+        for chunk in CHUNKS:
+            recorder.write(chunk)
+            time.sleep(0.05)
+        recorder.close()
+
+    # Open the port before the replay starts, as open_serial does, opening clears input already waiting
+    def replay_port(self, replay, size, timeout=5):
+        data = b''
+        with serial.Serial(replay.port, timeout=0.1) as ser:
+            replay.start()
+            deadline = time.monotonic() + timeout
+            while len(data) < size and time.monotonic() < deadline:
+                data += ser.read(size - len(data))
+        return data
+
+    def test_records(self):
+        '''Every chunk is read back in order with increasing timestamps'''
+        with open(self.path, 'rb') as f:
+            records = list(read_records(f))
+        assert [data for _, data in records] == CHUNKS
+        timestamps = [timestamp for timestamp, _ in records]
+        assert timestamps == sorted(timestamps)
+        assert timestamps[-1] - timestamps[0] >= 0.15e9
+
+    def test_not_a_recording(self):
+        '''Other files are rejected'''
+        with open(self.path, 'wb') as f:
+            f.write(b'hello')
+        with open(self.path, 'rb') as f, self.assertRaises(ValueError):
+            list(read_records(f))
+
+    def test_replay_round_trip(self):
+        '''A replayed recording reads back byte for byte from its pseudo terminal'''
+        replay = SerialReplay(self.path, speed=0)
+        try:
+            assert self.replay_port(replay, sum(map(len, CHUNKS))) == b''.join(CHUNKS)
+        finally:
+            replay.stop()
+
+    def test_replay_timing(self):
+        '''speed 1 keeps the recorded gaps'''
+        replay = SerialReplay(self.path, speed=1)
+        try:
+            start = time.monotonic()
+            assert self.replay_port(replay, sum(map(len, CHUNKS))) == b''.join(CHUNKS)
+            assert time.monotonic() - start >= 0.15
+        finally:
+            replay.stop()
+
+    def test_failed_open_closes_replay(self):
+        '''A port that fails to open leaves no pseudo terminal behind'''
+        connection = DeviceSerialConnection({'id': '000000000001', 'type': 'DTA',
+                                             'connectionProperties': {'port': '/dev/null', 'replay': self.path}})
+        connection.properties = connection.get_properties()
+        open_fds = len(os.listdir('/proc/self/fd'))
+        with mock.patch('serial.Serial', side_effect=serial.SerialException('unplugged')):
+            for _ in range(3):
+                with self.assertRaises(serial.SerialException):
+                    connection.open_serial()
+        assert connection.replay is None
+        assert len(os.listdir('/proc/self/fd')) == open_fds
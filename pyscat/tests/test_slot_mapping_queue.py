@@ -0,0 +1,159 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+'''
+Description:
+    Tests for batching slot mapping changes into one write and one apply
+Command:
+    pytest -v pyscat/tests/test_slot_mapping_queue.py
+'''
+import copy
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from pyscat.config import Config
+from pyscat.config_watcher import ConfigWatcher
+from pyscat.device_config import DeviceConfig
+from pyscat.slot_mapping_queue import SlotMappingQueue
+
+
+class RecordingConnectionManager:
+    '''Connection manager that records the device lists it is given'''
+
+    def __init__(self):
+        self.updates = []
+
+    def update_devices(self, devices):
+        self.updates.append(devices)
+        return {'devices': len(devices['devices'])}
+
+
+class SlotMappingQueueTest(unittest.TestCase):
+    '''
+    SlotMappingQueue Test
+    '''
+
+    def setUp(self) -> None:
+        devices_config = copy.copy(Config().devices_config)
+        devices_config.config_file_path = os.path.join(tempfile.mkdtemp(), 'devices.json')
+        with open(devices_config.config_file_path, 'w') as f:
+            json.dump({'devices': []}, f)
+        self.device_config = DeviceConfig(devices_config)
+        self.device_config.read_device_config()
+        self.writes = 0
+        write_device_config = self.device_config.write_device_config
+
+        def counting_write(devices):
+            self.writes += 1
+            write_device_config(devices)
+
+        self.device_config.write_device_config = counting_write
+        self.manager = RecordingConnectionManager()
+        self.queue = SlotMappingQueue(self.device_config, self.manager, debounce=0.2, max_delay=2)
+
+    def submit_slot(self, slot, value):
+        return self.queue.submit(lambda devices: self.device_config.set_slot_devices(devices, slot, value))
+
+    def test_burst_is_one_write(self):
+        '''Changes submitted together are written and applied once'''
+        futures = []
+        threads = [threading.Thread(target=lambda slot=slot: futures.append(self.submit_slot(slot, '1:%d' % slot)))
+                   for slot in range(1, 21)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results = [future.result(5) for future in futures]
+        assert self.writes == 1
+        assert len(self.manager.updates) == 1
+        assert results[0] == {'success': True, 'batchSize': 20, 'rejected': 0, 'changes': {'devices': 20}}
+        with open(self.device_config.devices_config.config_file_path) as f:
+            assert len(json.load(f)['devices']) == 20
+
+    def test_invalid_change_fails_alone(self):
+        '''A change that fails validation fails its own request, the rest of the batch is applied'''
+        good = self.submit_slot(1, '1:1')
+        bad = self.submit_slot(2, 'N/A')
+        duplicate = self.queue.submit(lambda devices: dict(devices, devices=devices['devices'] * 2))
+        result = good.result(5)
+        with self.assertRaises(ValueError):
+            bad.result(5)
+        with self.assertRaises(ValueError):
+            duplicate.result(5)
+        assert result['batchSize'] == 1 and result['rejected'] == 2
+        assert [device['id'] for device in self.device_config.read_device_config()['devices']] == ['000000000001']
+
+    def test_delete_in_same_batch(self):
+        '''A slot mapped and deleted in the same batch ends up without devices'''
+        self.submit_slot(1, '1:1')
+        result = self.queue.submit(lambda devices: self.device_config.remove_slot_devices(devices, 1)).result(5)
+        assert result['batchSize'] == 2
+        assert self.device_config.read_device_config()['devices'] == []
+
+    def test_reload_does_not_write(self):
+        '''A reload applies devices.json as it is on disk'''
+        result = self.queue.submit_reload().result(5)
+        assert self.writes == 0
+        assert result['batchSize'] == 0
+        assert len(self.manager.updates) == 1
+
+    def test_missing_file_fails_batch(self):
+        '''A devices.json that cannot be read fails its batch and the queue keeps going'''
+        path = self.device_config.devices_config.config_file_path
+        os.rename(path, path + '.away')
+        with self.assertRaises(FileNotFoundError):
+            self.submit_slot(1, '1:1').result(5)
+        os.rename(path + '.away', path)
+        assert self.submit_slot(1, '1:1').result(5)['batchSize'] == 1
+        assert self.queue.thread.is_alive()
+
+    def test_max_delay(self):
+        '''A steady stream of changes is applied at least every max_delay seconds'''
+        self.queue.debounce = 0.1
+        self.queue.max_delay = 0.3
+        first = self.submit_slot(1, '1:1')
+        start = time.monotonic()
+        while not first.done() and time.monotonic() - start < 2:
+            self.submit_slot(2, '1:2')
+            time.sleep(0.05)
+        assert first.done()
+        assert time.monotonic() - start < 1
+
+    def test_watcher_ignores_own_writes(self):
+        '''The queue's own writes do not come back as reloads from the devices.json watcher'''
+        reloads = []
+        watcher = ConfigWatcher(self.device_config.devices_config.config_file_path, lambda: reloads.append(1),
+                                'poll', 0.05, self.device_config.devices_file)
+        watcher.start()
+        try:
+            self.submit_slot(1, '1:1').result(5)
+            time.sleep(0.3)
+            assert reloads == []
+            edited = self.device_config.devices_config.config_file_path + '.edit'
+            with open(edited, 'w') as f:
+                json.dump({'devices': []}, f)
+            os.replace(edited, self.device_config.devices_config.config_file_path)
+            time.sleep(0.3)
+            assert reloads == [1]
+        finally:
+            watcher.stop()
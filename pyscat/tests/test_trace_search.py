@@ -0,0 +1,152 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+'''
+Description:
+    Tests for the full text search index of the trace lines
+Command:
+    pytest -v pyscat/tests/test_trace_search.py
+'''
+import logging
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from pyscat.trace_search import TraceSearchIndex
+from pyscat.trace_store import TraceBlockStore
+
+
+def make_record(slot: str, message: str, created: float = None) -> logging.LogRecord:
+    record = logging.LogRecord(slot, logging.INFO, '', 0, slot + '  ' + message, None, None)
+    if created is not None:
+        record.created = created
+    return record
+
+
+class TraceSearchIndexTest(unittest.TestCase):
+    '''
+    TraceSearchIndex Test
+    '''
+
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.index = TraceSearchIndex(os.path.join(self.directory, 'search.db'), 24, 1000000, 1024)
+        now = time.time()
+        self.index.write_batch([make_record('000000000001', 'boot ok', now - 30),
+                                make_record('000000000002', 'kernel panic - not syncing', now - 20),
+                                make_record('000000000001', 'Kernel panic again', now - 10),
+                                make_record('000000000001', 'panic kernel', now - 5)])
+        self.index.flush()
+
+    def tearDown(self) -> None:
+        self.index.stop()
+
+    def test_phrase_newest_first(self):
+        '''The words of the query match in that order, newest line first, without the slot prefix'''
+        results = self.index.search('kernel panic')['results']
+        assert [result['line'] for result in results] == ['Kernel panic again', 'kernel panic - not syncing']
+        assert results[0]['slot'] == '000000000001'
+
+    def test_slot_and_time_filters(self):
+        '''slot, since and until narrow the results'''
+        assert len(self.index.search('kernel panic', slot='000000000002')['results']) == 1
+        assert len(self.index.search('kernel panic', since=time.time() - 15)['results']) == 1
+        assert len(self.index.search('kernel panic', until=time.time() - 15)['results']) == 1
+
+    def test_paging(self):
+        '''Pages follow nextOffset until the last one'''
+        page = self.index.search('panic', limit=2)
+        assert len(page['results']) == 2 and page['nextOffset'] == 2
+        page = self.index.search('panic', limit=2, offset=page['nextOffset'])
+        assert len(page['results']) == 1 and page['nextOffset'] is None
+
+    def test_query_is_literal(self):
+        '''FTS syntax in the query is matched literally'''
+        assert self.index.search('panic OR boot')['results'] == []
+        assert self.index.search('"panic')['results'] != []
+        with self.assertRaises(ValueError):
+            self.index.search('   ')
+
+    def write_log(self, lines):
+        with open(os.path.join(self.directory, '000000000003.log'), 'w') as f:
+            for created, message in lines:
+                f.write(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(created))
+                        + ',%03d: 000000000003  %s\n' % (int(created * 1000) % 1000, message))
+
+    def test_rebuild(self):
+        '''A rebuild replaces the index with the lines of the text logs'''
+        self.write_log([(time.time() - 60, 'rebuilt line'), (time.time() - 48 * 3600, 'too old line')])
+        assert self.index.rebuild(self.directory) == 1
+        assert self.index.search('kernel panic')['results'] == []
+        assert [result['slot'] for result in self.index.search('rebuilt line')['results']] == ['000000000003']
+        assert self.index.search('too old')['results'] == []
+
+    def test_one_rebuild_at_a_time(self):
+        '''A second rebuild is refused while one runs, lines logged meanwhile are indexed right away'''
+        self.write_log([(time.time() - 60, 'logged before')])
+        reading = threading.Event()
+        release = threading.Event()
+        index_file = self.index.index_file
+
+        def slow_index_file(path, oldest, cutoff):
+            reading.set()
+            release.wait(5)
+            return index_file(path, oldest, cutoff)
+
+        self.index.index_file = slow_index_file
+        assert self.index.start_rebuild(self.directory)
+        assert reading.wait(5)
+        assert not self.index.start_rebuild(self.directory)
+        self.index.write_batch([make_record('000000000003', 'logged during'),
+                                make_record('000000000003', 'logged before', self.index.rebuild_cutoff - 1)])
+        self.index.flush()
+        assert len(self.index.search('logged during')['results']) == 1
+        release.set()
+        while self.index.rebuild_lock.locked():
+            time.sleep(0.01)
+        assert len(self.index.search('logged before')['results']) == 1
+        assert len(self.index.search('logged during')['results']) == 1
+        assert self.index.search('kernel panic')['results'] == []
+
+    def test_rebuild_from_blocks(self):
+        '''With trace_log_store blocks the rebuild reads the block stores'''
+        store = TraceBlockStore(os.path.join(self.directory, 'store', '000000000004'))
+        store.write_batch([make_record('000000000004', 'sealed line', time.time() - 60)])
+        store.seal()
+        store.write_batch([make_record('000000000004', 'unsealed line', time.time() - 30)])
+        try:
+            assert self.index.rebuild(self.directory, 'blocks') == 2
+        finally:
+            store.close()
+        assert [result['line'] for result in self.index.search('line')['results']] == ['unsealed line', 'sealed line']
+
+    def test_commit_without_flush(self):
+        '''Lines are committed and trimmed by the index itself, also when nothing calls flush'''
+        self.index.stop()
+        with mock.patch.object(TraceSearchIndex, 'commit_interval', 0.1):
+            self.index = TraceSearchIndex(os.path.join(self.directory, 'timer.db'), 24, 3, 1024)
+        self.index.trim_interval = 0
+        self.index.write_batch([make_record('000000000001', 'line %d' % i) for i in range(10)])
+        deadline = time.monotonic() + 3
+        while time.monotonic() < deadline and not self.index.search('line')['results']:
+            time.sleep(0.05)
+        assert [result['line'] for result in self.index.search('line')['results']] == ['line 9', 'line 8', 'line 7']
@@ -0,0 +1,114 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+'''
+Description:
+    Tests for time range queries of the trace block store
+Command:
+    pytest -v pyscat/tests/test_trace_store.py
+'''
+import logging
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from pyscat.trace_log_writer import TraceLogWriter, TraceQueueHandler
+from pyscat.trace_store import TraceBlockStore
+
+
+def make_record(created: float, message: str) -> logging.LogRecord:
+    record = logging.LogRecord('000000000001', logging.INFO, '', 0, message, None, None)
+    record.created = created
+    return record
+
+
+class TraceBlockStoreTest(unittest.TestCase):
+    '''
+    TraceBlockStore Test
+    '''
+
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.start = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0).timestamp()
+        # 1000 lines one second apart in blocks of a few lines
+        self.store = TraceBlockStore(self.directory, block_size=512, block_interval=3600, retention_days=5)
+        self.store.write_batch([make_record(self.start + i, 'line %d' % i) for i in range(1000)])
+
+    def tearDown(self) -> None:
+        self.store.close()
+
+    def test_range(self):
+        '''Only the lines inside the range are returned, oldest first'''
+        lines = list(TraceBlockStore.query(self.directory, self.start + 100, self.start + 199.5))
+        assert [message for _, message in lines] == ['line %d' % i for i in range(100, 200)]
+        day = TraceBlockStore.get_day(self.start)
+        blocks = os.path.getsize(os.path.join(self.directory, day + '.idx')) // TraceBlockStore.INDEX_ENTRY.size
+        assert blocks > 10
+
+    def test_unsealed_lines(self):
+        '''Lines that are not sealed into a block yet are served from memory'''
+        self.store.write_batch([make_record(self.start + 1000, 'pending')])
+        assert self.store.lines
+        lines = list(TraceBlockStore.query(self.directory, self.start + 998, self.start + 1001))
+        assert [message for _, message in lines] == ['line 998', 'line 999', 'pending']
+
+    def test_closed_store(self):
+        '''Closing seals the pending lines, they are read from disk afterwards'''
+        self.store.close()
+        lines = list(TraceBlockStore.query(self.directory, self.start + 990, self.start + 2000))
+        assert [message for _, message in lines] == ['line %d' % i for i in range(990, 1000)]
+
+    def test_range_across_days(self):
+        '''A range spanning midnight reads the files of both days'''
+        tomorrow = self.start + timedelta(days=1).total_seconds()
+        self.store.write_batch([make_record(tomorrow, 'tomorrow')])
+        self.store.close()
+        lines = list(TraceBlockStore.query(self.directory, self.start + 999, tomorrow))
+        assert [message for _, message in lines] == ['line 999', 'tomorrow']
+
+    def test_empty_range(self):
+        '''A range without lines returns nothing'''
+        assert list(TraceBlockStore.query(self.directory, self.start - 100, self.start - 1)) == []
+
+    def test_quiet_slot_is_sealed(self):
+        '''The writer seals the last block of a slot that went quiet once it is block_interval old'''
+        directory = tempfile.mkdtemp()
+        store = TraceBlockStore(directory, block_interval=0.5)
+        writer = TraceLogWriter(1000, flush_interval=0.1, fsync_interval=0)
+        handler = TraceQueueHandler(writer, [store])
+        try:
+            handler.handle(make_record(time.time(), 'last words'))
+            index = os.path.join(directory, TraceBlockStore.get_day(time.time()) + '.idx')
+            deadline = time.monotonic() + 3
+            while time.monotonic() < deadline and not (os.path.exists(index) and os.path.getsize(index)):
+                time.sleep(0.1)
+            assert os.path.getsize(index) == TraceBlockStore.INDEX_ENTRY.size
+            assert not store.lines
+        finally:
+            writer.stop()
+            store.close()
+
+    def test_parse_time(self):
+        '''Times are epoch seconds or ISO 8601'''
+        assert TraceBlockStore.parse_time('1700000000.5') == 1700000000.5
+        assert TraceBlockStore.parse_time('2024-05-01T10:00:00+00:00') == 1714557600
+        with self.assertRaises(ValueError):
+            TraceBlockStore.parse_time('yesterday')
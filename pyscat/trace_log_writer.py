@@ -0,0 +1,182 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from typing import List
+
+from pyscat.config import SCATDevicesConfig
+
+
+# Writes serial trace logs on a dedicated thread.
+# The read path only puts records on a queue. The writer groups everything queued per
+# TraceQueueHandler and writes each group with one write_batch call, flushes every flush_interval seconds and fsyncs every fsync_interval
+# seconds (0 disables fsync). When the queue is full records are dropped and counted rather
+# than blocking the serial reader.
+class TraceLogWriter:
+    writer = None
+    writer_lock = threading.Lock()
+    max_batch: int = 10000
+
+    def __init__(self, queue_size: int, flush_interval: float, fsync_interval: float):
+        self.queue = queue.SimpleQueue()
+        self.queue_size = queue_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.written = 0
+        self.dropped = 0
+        self.unflushed = set()
+        self.unsynced = set()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='trace-log-writer', daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    @staticmethod
+    def get_writer(devices_config: SCATDevicesConfig):
+        with TraceLogWriter.writer_lock:
+            if TraceLogWriter.writer is None:
+                TraceLogWriter.writer = TraceLogWriter(devices_config.trace_log_queue_size,
+                                                       devices_config.trace_log_flush_interval,
+                                                       devices_config.trace_log_fsync_interval)
+            return TraceLogWriter.writer
+
+    def put(self, source, record: logging.LogRecord) -> None:
+        if self.queue.qsize() >= self.queue_size:
+            self.dropped += 1
+            return
+        self.queue.put((source, record))
+
+    # Close the targets of source after the records already queued for them are written
+    def close_handler(self, source) -> None:
+        if self.thread.is_alive():
+            self.queue.put((source, None))
+        else:
+            self.close_targets(source)
+
+    def close_targets(self, source):
+        source.targets_closed = True
+        for handler in source.targets:
+            self.unflushed.discard(handler)
+            self.unsynced.discard(handler)
+            handler.close()
+
+    def run(self):
+        last_flush = last_sync = time.monotonic()
+        while self.running or not self.queue.empty():
+            self.write_pending()
+            now = time.monotonic()
+            if now - last_flush >= self.flush_interval:
+                last_flush = now
+                self.flush()
+            if self.fsync_interval and now - last_sync >= self.fsync_interval:
+                last_sync = now
+                self.sync()
+        self.flush()
+
+    # Wait for records and write everything queued, grouped per queue handler.
+    # A None record asks to close the handler's targets, records that arrive after that are dropped
+    def write_pending(self):
+        try:
+            item = self.queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return
+        batches = {}
+        count = 0
+        while True:
+            batches.setdefault(item[0], []).append(item[1])
+            count += 1
+            if count >= self.max_batch:
+                break
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+        for source, records in batches.items():
+            closing = None in records
+            if closing:
+                records = [record for record in records if record is not None]
+            if source.targets_closed:
+                self.dropped += len(records)
+                continue
+            if records:
+                for handler in source.targets:
+                    try:
+                        handler.write_batch(records)
+                    except Exception:
+                        handler.handleError(records[0])
+                    self.unflushed.add(handler)
+                    self.unsynced.add(handler)
+                self.written += len(records)
+            if closing:
+                self.close_targets(source)
+
+    # A target whose flush returns True still holds lines in memory (see TraceBlockStore) and is flushed again
+    # on the next flush_interval, whether or not more records arrive
+    def flush(self):
+        pending = set()
+        for handler in self.unflushed:
+            if handler.flush():
+                pending.add(handler)
+            self.unsynced.add(handler)
+        self.unflushed = pending
+
+    def sync(self):
+        for handler in self.unsynced:
+            handler.sync()
+        self.unsynced.clear()
+
+    def stop(self):
+        self.running = False
+        self.thread.join(timeout=5)
+        self.sync()
+
+    def stats(self) -> dict:
+        return {'queueDepth': self.queue.qsize(),
+                'written': self.written,
+                'dropped': self.dropped}
+
+
+# Logging handler that hands records to the TraceLogWriter instead of writing them.
+# Targets are handlers with write_batch, flush and sync, the writer calls them on its thread.
+# flush may return True to be called again while it has lines it did not write yet.
+class TraceQueueHandler(logging.Handler):
+
+    def __init__(self, writer: TraceLogWriter, targets: List[logging.Handler]):
+        super().__init__()
+        self.writer = writer
+        self.targets = tuple(targets)
+        self.targets_closed = False
+
+    # No handler lock on the read path, the queue is thread safe
+    def handle(self, record):
+        if self.filter(record):
+            self.writer.put(self, record)
+        return True
+
+    def emit(self, record):
+        self.writer.put(self, record)
+
+    # The targets are closed by the writer, after the records queued before
+    def close(self):
+        self.writer.close_handler(self)
+        super().close()
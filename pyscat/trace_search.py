@@ -0,0 +1,278 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+import atexit
+import gzip
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from pyscat.config import SCATDevicesConfig
+from pyscat.trace_store import TraceBlockStore
+
+
+# Full text index of the trace lines of every slot, kept in an SQLite FTS5 database.
+# Lines are added as they are logged and committed every commit_interval seconds by a timer of the index,
+# so this does not depend on the TraceLogWriter flushing. The index only keeps the last retention_hours of
+# output and at most max_lines lines, so its disk footprint is bounded; its memory footprint is bounded by
+# the SQLite page cache (cache_kb).
+# It is shared by every slot logger and can be rebuilt from the text trace logs or the block stores.
+class TraceSearchIndex(logging.Handler):
+    index = None
+    index_lock = threading.Lock()
+    commit_interval: float = 1
+    trim_interval: float = 60
+    # <asctime>: <slot>  <line> as written by the trace loggers
+    LOG_LINE = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),(\d{3}): (\S+)  (.*)$')
+
+    def __init__(self, path: str, retention_hours: float, max_lines: int, cache_kb: int):
+        super().__init__()
+        self.path = path
+        self.retention = retention_hours * 3600
+        self.max_lines = max_lines
+        self.cache_kb = cache_kb
+        self.db_lock = threading.Lock()
+        # held while a rebuild runs, it reads the lines logged before rebuild_cutoff
+        self.rebuild_lock = threading.Lock()
+        self.rebuild_cutoff = None
+        self.db = self.connect()
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS lines (id INTEGER PRIMARY KEY, slot TEXT, created REAL, line TEXT);
+            CREATE INDEX IF NOT EXISTS lines_created ON lines (created);
+            CREATE VIRTUAL TABLE IF NOT EXISTS lines_fts USING fts5(line, content='lines', content_rowid='id');
+            CREATE TRIGGER IF NOT EXISTS lines_insert AFTER INSERT ON lines BEGIN
+                INSERT INTO lines_fts (rowid, line) VALUES (new.id, new.line);
+            END;
+            CREATE TRIGGER IF NOT EXISTS lines_delete AFTER DELETE ON lines BEGIN
+                INSERT INTO lines_fts (lines_fts, rowid, line) VALUES ('delete', old.id, old.line);
+            END;
+        ''')
+        self.db.commit()
+        self.last_commit = time.monotonic()
+        self.last_trim = 0.0
+        self.uncommitted = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='trace-search-commit', daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    @staticmethod
+    def get_index(devices_config: SCATDevicesConfig):
+        with TraceSearchIndex.index_lock:
+            if TraceSearchIndex.index is None:
+                TraceSearchIndex.index = TraceSearchIndex(os.path.join(devices_config.trace_log_base, 'search.db'),
+                                                          devices_config.trace_search_retention_hours,
+                                                          devices_config.trace_search_max_lines,
+                                                          devices_config.trace_search_cache_kb)
+            return TraceSearchIndex.index
+
+    def connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        db.execute('PRAGMA cache_size=-%d' % self.cache_kb)
+        return db
+
+    # Message of a trace record without the "<slot>  " prefix
+    @staticmethod
+    def get_line(record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        prefix = record.name + '  '
+        return message[len(prefix):] if message.startswith(prefix) else message
+
+    def emit(self, record):
+        self.write_batch([record])
+
+    # While a rebuild runs, lines logged before its cutoff are left to the rebuild, which reads them from the logs
+    def write_batch(self, records):
+        with self.db_lock:
+            cutoff = self.rebuild_cutoff
+            rows = [(record.name, record.created, self.get_line(record)) for record in records
+                    if cutoff is None or record.created >= cutoff]
+            self.db.executemany('INSERT INTO lines (slot, created, line) VALUES (?, ?, ?)', rows)
+            self.uncommitted = True
+
+    def commit(self):
+        self.db.commit()
+        self.last_commit = time.monotonic()
+        self.uncommitted = False
+
+    # Commit and trim on the index's own schedule, with the async or the sync trace log writer
+    def run(self):
+        while not self.stopped.wait(self.commit_interval):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logging.getLogger('system').error("Trace search commit failed " + repr(e))
+
+    def flush(self):
+        with self.db_lock:
+            self.trim()
+            if self.uncommitted:
+                self.commit()
+
+    def sync(self):
+        self.flush()
+
+    # The index is shared by every slot logger, it is not closed with them
+    def close(self):
+        pass
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.flush()
+
+    # Remove lines older than the retention and beyond max_lines, at most once every trim_interval
+    def trim(self):
+        now = time.monotonic()
+        if now - self.last_trim < self.trim_interval:
+            return
+        self.last_trim = now
+        self.db.execute('DELETE FROM lines WHERE created < ?', (time.time() - self.retention,))
+        self.db.execute('DELETE FROM lines WHERE id <= (SELECT max(id) FROM lines) - ?', (self.max_lines,))
+        self.uncommitted = True
+
+    # Lines containing the words of the query in that order, newest first
+    def search(self, query: str, slot: Optional[str] = None, since: Optional[float] = None,
+               until: Optional[float] = None, limit: int = 100, offset: int = 0) -> dict:
+        words = query.split()
+        if not words:
+            raise ValueError("Empty search query")
+        # the query is quoted so it is matched literally as a phrase
+        match = '"' + ' '.join(word.replace('"', '""') for word in words) + '"'
+        sql = ('SELECT lines.slot, lines.created, lines.line FROM lines_fts '
+               'JOIN lines ON lines.id = lines_fts.rowid WHERE lines_fts MATCH ?')
+        parameters = [match]
+        if slot is not None:
+            sql += ' AND lines.slot = ?'
+            parameters.append(slot)
+        if since is not None:
+            sql += ' AND lines.created >= ?'
+            parameters.append(since)
+        if until is not None:
+            sql += ' AND lines.created <= ?'
+            parameters.append(until)
+        sql += ' ORDER BY lines.created DESC, lines.id DESC LIMIT ? OFFSET ?'
+        parameters += [limit + 1, offset]
+        reader = sqlite3.connect(self.path)
+        try:
+            rows = reader.execute(sql, parameters).fetchall()
+        finally:
+            reader.close()
+        results = [{'slot': row[0],
+                    'timestamp': datetime.fromtimestamp(row[1]).isoformat(timespec='milliseconds'),
+                    'line': row[2]} for row in rows[:limit]]
+        return {'results': results,
+                'nextOffset': offset + limit if len(rows) > limit else None}
+
+    # Recreate the index from the trace logs in directory: the text trace logs (<slot>.log and rotated
+    # <slot>.log.<date>[.gz]), or with store 'blocks' the block stores under directory/store (see trace_log_store)
+    def rebuild(self, directory: str, store: str = 'text') -> int:
+        with self.rebuild_lock:
+            return self.index_files(directory, store)
+
+    # Rebuild in a background thread, False when a rebuild is already running
+    def start_rebuild(self, directory: str, store: str = 'text') -> bool:
+        if not self.rebuild_lock.acquire(blocking=False):
+            return False
+        threading.Thread(target=self.run_rebuild, args=(directory, store), name='trace-search-rebuild',
+                         daemon=True).start()
+        return True
+
+    def run_rebuild(self, directory: str, store: str):
+        try:
+            count = self.index_files(directory, store)
+            logging.getLogger('system').info("Trace search index rebuilt with " + str(count) + " lines")
+        except Exception as e:
+            logging.getLogger('system').error("Trace search rebuild failed " + repr(e))
+        finally:
+            self.rebuild_lock.release()
+
+    # Lines logged before the rebuild started are read from the logs, lines logged while it runs are added
+    # as they arrive, so a line is indexed once and nothing is kept in memory meanwhile
+    def index_files(self, directory: str, store: str = 'text') -> int:
+        oldest = time.time() - self.retention
+        count = 0
+        with self.db_lock:
+            self.rebuild_cutoff = time.time()
+            self.db.execute('DELETE FROM lines')
+            self.db.execute("INSERT INTO lines_fts (lines_fts) VALUES ('rebuild')")
+            self.commit()
+        cutoff = self.rebuild_cutoff
+        try:
+            if store == 'blocks':
+                store_directory = os.path.join(directory, 'store')
+                for slot in sorted(os.listdir(store_directory)) if os.path.isdir(store_directory) else []:
+                    count += self.index_store(os.path.join(store_directory, slot), slot, oldest, cutoff)
+            else:
+                for file_name in sorted(os.listdir(directory)):
+                    if '.log' not in file_name or '-error.log' in file_name or file_name.startswith(('system.', '.')):
+                        continue
+                    path = os.path.join(directory, file_name)
+                    if os.path.getmtime(path) < oldest:
+                        continue
+                    count += self.index_file(path, oldest, cutoff)
+        finally:
+            with self.db_lock:
+                self.rebuild_cutoff = None
+        return count
+
+    def index_file(self, path: str, oldest: float, cutoff: float) -> int:
+        opener = gzip.open if path.endswith('.gz') else open
+        rows = []
+        count = 0
+        with opener(path, 'rt', encoding='utf-8', errors='backslashreplace') as f:
+            for text in f:
+                match = self.LOG_LINE.match(text.rstrip('\n'))
+                if match is None:
+                    continue
+                created = time.mktime(time.strptime(match.group(1), '%Y-%m-%d %H:%M:%S')) + int(match.group(2)) / 1000
+                if not oldest <= created < cutoff:
+                    continue
+                rows.append((match.group(3), created, match.group(4)))
+                if len(rows) >= 10000:
+                    count += self.insert_rows(rows)
+                    rows = []
+        return count + self.insert_rows(rows)
+
+    # Lines of the TraceBlockStore of slot in directory, stored with the "<slot>  " prefix
+    def index_store(self, directory: str, slot: str, oldest: float, cutoff: float) -> int:
+        prefix = slot + '  '
+        rows = []
+        count = 0
+        for created, line in TraceBlockStore.query(directory, oldest, cutoff):
+            if created >= cutoff:
+                continue
+            rows.append((slot, created, line[len(prefix):] if line.startswith(prefix) else line))
+            if len(rows) >= 10000:
+                count += self.insert_rows(rows)
+                rows = []
+        return count + self.insert_rows(rows)
+
+    def insert_rows(self, rows: List[tuple]) -> int:
+        with self.db_lock:
+            self.db.executemany('INSERT INTO lines (slot, created, line) VALUES (?, ?, ?)', rows)
+            self.commit()
+        return len(rows)
@@ -0,0 +1,208 @@
+# Copyright 2024 Comcast Cable Communications Management, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+
+import bisect
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import date, datetime, timedelta
+from typing import Iterator, Tuple
+
+
+# Time indexed store of the trace lines of one slot.
+# Lines are kept in one data file per day as zlib compressed blocks of "<timestamp>\t<line>\n".
+# Each sealed block gets an entry in the day's index file with its first and last timestamp and
+# its offset and length in the data file, so a time range query only reads and decompresses the
+# blocks that overlap the range. A block is sealed once it holds block_size bytes, or on flush
+# once it is older than block_interval seconds, also when no line arrived since; lines not sealed yet are
+# served from memory.
+class TraceBlockStore(logging.Handler):
+    INDEX_ENTRY = struct.Struct('<ddQI')
+    # live stores by directory, queries use them to include lines that are not sealed yet
+    stores = {}
+
+    def __init__(self, directory: str, block_size: int = 65536, block_interval: float = 10,
+                 retention_days: int = 5):
+        super().__init__()
+        self.directory = directory
+        self.block_size = block_size
+        self.block_interval = block_interval
+        self.retention_days = retention_days
+        self.day = None
+        self.data_file = None
+        self.index_file = None
+        self.lines = []
+        self.size = 0
+        self.started = 0.0
+        os.makedirs(directory, exist_ok=True)
+        TraceBlockStore.stores[directory] = self
+
+    @staticmethod
+    def get_day(timestamp: float) -> str:
+        return time.strftime('%Y-%m-%d', time.localtime(timestamp))
+
+    def emit(self, record):
+        self.write_batch([record])
+
+    def write_batch(self, records):
+        self.acquire()
+        try:
+            for record in records:
+                day = self.get_day(record.created)
+                if day != self.day:
+                    self.seal()
+                    self.open_day(day)
+                if not self.lines:
+                    self.started = time.monotonic()
+                line = record.getMessage()
+                self.lines.append((record.created, line))
+                self.size += len(line) + 20
+                if self.size >= self.block_size:
+                    self.seal()
+        finally:
+            self.release()
+
+    def open_day(self, day: str):
+        self.close_files()
+        self.day = day
+        self.data_file = open(os.path.join(self.directory, day + '.blk'), 'ab')
+        self.index_file = open(os.path.join(self.directory, day + '.idx'), 'ab')
+        self.remove_old_days()
+
+    # Compress the lines collected so far into a block and index it
+    def seal(self):
+        if not self.lines:
+            return
+        payload = ''.join('%.6f\t%s\n' % line for line in self.lines).encode('utf-8', 'backslashreplace')
+        block = zlib.compress(payload)
+        offset = self.data_file.tell()
+        self.data_file.write(block)
+        self.data_file.flush()
+        self.index_file.write(self.INDEX_ENTRY.pack(self.lines[0][0], self.lines[-1][0], offset, len(block)))
+        self.index_file.flush()
+        self.lines = []
+        self.size = 0
+
+    # Returns True while lines are waiting for their block to be sealed, so the writer flushes again
+    def flush(self):
+        self.acquire()
+        try:
+            if self.lines and time.monotonic() - self.started >= self.block_interval:
+                self.seal()
+            return bool(self.lines)
+        finally:
+            self.release()
+
+    def sync(self):
+        self.acquire()
+        try:
+            for f in (self.data_file, self.index_file):
+                if f is not None:
+                    os.fsync(f.fileno())
+        finally:
+            self.release()
+
+    def close_files(self):
+        for f in (self.data_file, self.index_file):
+            if f is not None:
+                f.close()
+        self.data_file = None
+        self.index_file = None
+
+    def close(self):
+        self.acquire()
+        try:
+            self.seal()
+            self.close_files()
+            if TraceBlockStore.stores.get(self.directory) is self:
+                del TraceBlockStore.stores[self.directory]
+        finally:
+            self.release()
+        super().close()
+
+    def remove_old_days(self):
+        oldest = (date.today() - timedelta(days=self.retention_days)).isoformat()
+        for file_name in os.listdir(self.directory):
+            if file_name[:10] < oldest and file_name.endswith(('.blk', '.idx')):
+                os.remove(os.path.join(self.directory, file_name))
+
+    # Epoch seconds or an ISO 8601 date/time, local time when no offset is given
+    @staticmethod
+    def parse_time(value: str) -> float:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            raise ValueError("Invalid time " + value)
+
+    # Lines formatted like the text trace log
+    @staticmethod
+    def format_line(timestamp: float, message: str) -> str:
+        return (time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+                + ',%03d: ' % (int(timestamp * 1000) % 1000) + message + '\n')
+
+    # Lines of the store between start and end (epoch seconds), oldest first
+    @staticmethod
+    def query(directory: str, start: float, end: float) -> Iterator[Tuple[float, str]]:
+        day = datetime.fromtimestamp(start).date()
+        last_day = datetime.fromtimestamp(end).date()
+        while day <= last_day:
+            yield from TraceBlockStore.query_day(directory, day.isoformat(), start, end)
+            day += timedelta(days=1)
+
+        store = TraceBlockStore.stores.get(directory)
+        if store is not None:
+            store.acquire()
+            try:
+                pending = list(store.lines)
+            finally:
+                store.release()
+            for timestamp, line in pending:
+                if start <= timestamp <= end:
+                    yield timestamp, line
+
+    @staticmethod
+    def query_day(directory: str, day: str, start: float, end: float) -> Iterator[Tuple[float, str]]:
+        try:
+            with open(os.path.join(directory, day + '.idx'), 'rb') as f:
+                index = f.read()
+        except FileNotFoundError:
+            return
+        entry_size = TraceBlockStore.INDEX_ENTRY.size
+        entries = [TraceBlockStore.INDEX_ENTRY.unpack_from(index, position)
+                   for position in range(0, len(index) - entry_size + 1, entry_size)]
+        # blocks are written in time order, skip straight to the first one that ends after start
+        first = bisect.bisect_left([entry[1] for entry in entries], start)
+        with open(os.path.join(directory, day + '.blk'), 'rb') as data_file:
+            for first_timestamp, last_timestamp, offset, length in entries[first:]:
+                if first_timestamp > end:
+                    break
+                data_file.seek(offset)
+                payload = zlib.decompress(data_file.read(length)).decode('utf-8')
+                for line in payload.split('\n')[:-1]:
+                    timestamp, message = line.split('\t', 1)
+                    timestamp = float(timestamp)
+                    if start <= timestamp <= end:
+                        yield timestamp, message
@@ -18,8 +18,17 @@
 
 import asyncio
 import logging
+from threading import Lock
+from typing import List
+from urllib.parse import urlparse, parse_qs
 from websockets import WebSocketServerProtocol
 from websockets import WebSocketClientProtocol
+from websockets.extensions.permessage_deflate import PerMessageDeflate, ServerPerMessageDeflateFactory
+from websockets.frames import Frame, prepare_data
+from pyscat.client_queue import WebSocketClientQueue
+from pyscat.config import Config
+from pyscat.loop_bridge import LoopBridge
+from pyscat.scrollback import ScrollbackBuffer
 from pyscat.serial.device_serial import DeviceSerialConnection
 from pyscat.serial.serial_discover import SerialAutoDiscover
 from pyscat.serial.serial_health import SerialHealthCheck
@@ -33,41 +42,112 @@ class WebSocketServer:
     slot_socket_map = {}
     # web socket to serial device mapping
     slot_device_map = {}
+    # recent output of every slot, replayed to clients that ask for it on connect
+    slot_scrollback_map = {}
+    fanout_lock = Lock()
+    config = Config()
+
+    def __init__(self):
+        # hands serial output to the websocket server loop, clients are only written to from that loop
+        self.bridge = LoopBridge(self.fanout_batches)
+
+    # Extensions offered for ws_compression. permessage-deflate is negotiated without server context takeover,
+    # every message is compressed on its own so clients with the same parameters can share the compressed frames
+    @staticmethod
+    def get_extensions(compression: str):
+        if compression != 'deflate':
+            return None
+        return [ServerPerMessageDeflateFactory(server_no_context_takeover=True,
+                                               server_max_window_bits=12,
+                                               client_max_window_bits=12,
+                                               compress_settings={'memLevel': 5})]
+
+    # Clients with the same key receive the same bytes for the same messages: () without extensions,
+    # the deflate parameters without context takeover, None when the client needs frames of its own
+    @staticmethod
+    def get_frames_key(ws: WebSocketServerProtocol):
+        if not ws.extensions:
+            return ()
+        if len(ws.extensions) == 1 and isinstance(ws.extensions[0], PerMessageDeflate):
+            deflate = ws.extensions[0]
+            if deflate.local_no_context_takeover:
+                return (deflate.local_max_window_bits, tuple(sorted(deflate.compress_settings.items())))
+        return None
+
+    # Frames of messages as client writes them. Deflate uses a copy of the client's extension, which keeps
+    # no state between messages, so the client's own extension is not touched
+    @staticmethod
+    def serialize_frames(messages: List[str], ws: WebSocketServerProtocol) -> bytes:
+        extensions = [PerMessageDeflate(deflate.remote_no_context_takeover, True, deflate.remote_max_window_bits,
+                                        deflate.local_max_window_bits, deflate.compress_settings)
+                      for deflate in ws.extensions]
+        return b''.join(Frame(*prepare_data(message)).serialize(mask=False, extensions=extensions)
+                        for message in messages)
+
+    # slot requested by a websocket client, ws://host:15080/<slot>?lines=<n>&bytes=<n>
+    @staticmethod
+    def get_slot(path: str) -> str:
+        return urlparse(path).path.strip("/")
+
+    def get_scrollback(self, slot: str) -> ScrollbackBuffer:
+        scrollback = self.slot_scrollback_map.get(slot)
+        if scrollback is None:
+            scrollback = self.slot_scrollback_map.setdefault(
+                slot, ScrollbackBuffer(self.config.devices_config.scrollback_bytes))
+        return scrollback
+
+    # scrollback requested with the lines and/or bytes query parameters
+    def get_replay(self, slot: str, uri: str) -> List[str]:
+        query = parse_qs(urlparse(uri).query)
+        try:
+            max_lines = int(query['lines'][0]) if 'lines' in query else None
+            max_bytes = int(query['bytes'][0]) if 'bytes' in query else None
+        except ValueError:
+            raise ValueError("Invalid scrollback request " + uri)
+        if max_lines is None and max_bytes is None:
+            return []
+        return self.get_scrollback(slot).tail(max_lines, max_bytes)
 
     # register every serial device so that websocket server knows how to send commands recvd from clients
     async def register_device(self, slot: str, device: DeviceSerialConnection) -> None:
         self.slot_device_map[slot] = device
         logging.debug(self.slot_device_map)
 
-    # register every websocket client to slot mapping
-    async def register_socket(self, slot: str, ws: WebSocketServerProtocol) -> None:
+    # register every websocket client to slot mapping, the requested scrollback is queued ahead of live output
+    async def register_socket(self, slot: str, ws: WebSocketServerProtocol, uri: str = "") -> None:
         try:
             if not self.slot_device_map[slot]:
                 raise ValueError("Invalid slot "+slot)
         except KeyError:
             raise ValueError("Invalid slot " + slot)
 
-        if slot not in self.slot_socket_map or not self.slot_socket_map[slot]:
-            self.slot_socket_map[slot] = set()
-
-        self.slot_socket_map[slot].add(ws)
+        client = WebSocketClientQueue(ws, self.config.devices_config.ws_client_queue_size,
+                                      self.config.devices_config.ws_client_overflow)
+        with self.fanout_lock:
+            client.put(self.get_replay(slot, uri))
+            if slot not in self.slot_socket_map or not self.slot_socket_map[slot]:
+                self.slot_socket_map[slot] = {}
+            self.slot_socket_map[slot][ws] = client
+        client.start()
         logging.info(ws.remote_address)
 
     # unregister every websocket client to slot mapping
     async def unregister_socket(self, slot: str, ws: WebSocketServerProtocol) -> None:
-        if self.slot_socket_map[slot]:
-            self.slot_socket_map[slot].remove(ws)
-        logging.info(ws.remote_address)
+        with self.fanout_lock:
+            client = self.slot_socket_map[slot].pop(ws, None) if self.slot_socket_map.get(slot) else None
+        if client is not None:
+            client.stop()
+            logging.info(str(ws.remote_address) + " " + str(client.stats()))
 
     # websocket callback when clients connect.
     async def ws_handler(self, ws: WebSocketServerProtocol, uri: str) -> None:
-        slot = uri.strip("/")
+        slot = self.get_slot(uri)
 
         try:
-            await self.register_socket(slot, ws)
-            # register consumer to consume incoming messages
-            await self.consume_handler(ws)
+            await self.register_socket(slot, ws, uri)
             try:
+                # register consumer to consume incoming messages
+                await self.consume_handler(ws)
                 await self.distribute(slot, "")
             finally:
                 await self.unregister_socket(slot, ws)
@@ -93,7 +173,7 @@ class WebSocketServer:
                 serial_health = SerialHealthCheck()
                 serial_health.report_health(self.slot_device_map)
             else:
-                device = self.slot_device_map[websocket.path[1:]]
+                device = self.slot_device_map[self.get_slot(websocket.path)]
                 await device.send_message(message)
 
     # send messages from http to  serial for slots
@@ -112,5 +192,55 @@ class WebSocketServer:
 
     # send messages from serial device to websocket client for slots
     async def distribute(self, slot, message: str) -> None:
-        if slot in self.slot_socket_map and self.slot_socket_map[slot]:
-            await asyncio.wait([asyncio.create_task(client.send(message)) for client in self.slot_socket_map[slot]])
+        await self.distribute_lines(slot, [message], scrollback=False)
+
+    # send a batch of messages from serial device to every websocket client of the slot.
+    # Never waits for the clients, batches from serial reader threads are handed to the websocket
+    # server loop through the bridge and delivered together on its next wake up.
+    async def distribute_lines(self, slot, messages: List[str], scrollback: bool = True) -> None:
+        if not messages:
+            return
+        loop = self.bridge.loop
+        if loop is None or loop is asyncio.get_running_loop():
+            self.fanout(slot, messages, scrollback)
+        else:
+            self.bridge.push((slot, messages, scrollback))
+
+    # Batches of the same slot that arrived between two wake ups are merged into one fan out
+    def fanout_batches(self, batches) -> None:
+        merged = {}
+        for slot, messages, scrollback in batches:
+            merged.setdefault((slot, scrollback), []).extend(messages)
+        for (slot, scrollback), messages in merged.items():
+            self.fanout(slot, messages, scrollback)
+
+    # Each frame is serialized (and compressed) once per group of clients with the same frames key and the
+    # same bytes are written to every client of the group that keeps up.
+    # Clients that fall behind are served from their queue, see WebSocketClientQueue.
+    def fanout(self, slot, messages: List[str], scrollback: bool = True) -> None:
+        with self.fanout_lock:
+            if scrollback:
+                self.get_scrollback(slot).extend(messages)
+            if slot not in self.slot_socket_map or not self.slot_socket_map[slot]:
+                return
+            frames = {}
+            for client in self.slot_socket_map[slot].values():
+                try:
+                    if not client.is_writable():
+                        client.put(messages)
+                        continue
+                    key = self.get_frames_key(client.ws)
+                    if key is None:
+                        client.write_messages(messages)
+                        continue
+                    if key not in frames:
+                        frames[key] = self.serialize_frames(messages, client.ws)
+                    client.write_frames(frames[key], len(messages))
+                except Exception as e:
+                    logging.info(str(client.ws.remote_address) + " " + repr(e))
+
+    # lag and drop counters of every connected websocket client
+    def get_client_stats(self) -> dict:
+        with self.fanout_lock:
+            return {slot: [client.stats() for client in clients.values()]
+                    for slot, clients in self.slot_socket_map.items() if clients}